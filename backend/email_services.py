@@ -1,7 +1,12 @@
 import imaplib
 import smtplib
+import socket
 import ssl
 import email
+import email.parser
+import email.policy
+import hashlib
+import importlib
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -11,8 +16,13 @@ from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import re
 import time
+import threading
 import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 import os
 from pydantic import BaseModel, Field
 import json
@@ -21,8 +31,145 @@ from email_reply_parser import EmailReplyParser
 
 logger = logging.getLogger(__name__)
 
+# UID FETCH batching: messages per command, and a cap on the UID set's length so
+# servers don't reject the command line as too long
+FETCH_BATCH_SIZE = 100
+FETCH_BATCH_MAX_BYTES = 8000
+
+# Fetch the full header but only the first 256 KB of the body: the text parts come
+# first, so large attachments stay on the server. PEEK leaves \Seen to mark_emails_as_read
+FETCH_TEXT_MAX_BYTES = 256 * 1024
+FETCH_ITEMS = f'(UID RFC822.SIZE BODY.PEEK[HEADER] BODY.PEEK[TEXT]<0.{FETCH_TEXT_MAX_BYTES}>)'
+
+_FETCH_UID_RE = re.compile(rb'UID (\d+)')
+_FETCH_SIZE_RE = re.compile(rb'RFC822\.SIZE (\d+)')
+_FETCH_START_RE = re.compile(rb'\d+ \(')
+_FETCH_SECTION_RE = re.compile(rb'BODY\[(HEADER|TEXT)\](?:<\d+>)? \{\d+\}$')
+
+# Common quote headers and the signature delimiter, tried before EmailReplyParser. "On ...
+# wrote:" must end its line, and "From:" only counts as the start of a header block, so
+# ordinary sentences that happen to begin that way are not cut
+_QUOTE_RE = re.compile(
+    r'^(?:On\b.*\bwrote:\s*$|-{2,}\s*Original Message\s*-{2,}|From:\s.*\r?\n(?:Sent|Date|To|Cc|Subject):)',
+    re.MULTILINE
+)
+_SIGNATURE_RE = re.compile(r'^-- ?\r?$', re.MULTILINE)
+
+# Trailing "(MODSEQ n)" of a CONDSTORE SEARCH response
+_SEARCH_MODSEQ_RE = re.compile(rb'\(MODSEQ (\d+)\)')
+
+# Shared headers-only parser: stops at the blank line, so the body is never parsed
+HEADER_PARSER = email.parser.BytesHeaderParser(policy=email.policy.compat32)
+
+# Reply/forward prefix stripped from subjects before thread hashing
+_SUBJECT_PREFIX_RE = re.compile(r'^(?:re|fwd?):\s*', re.IGNORECASE)
+
+# Connection pool limits: concurrent connections per account, and how long an idle
+# connection is kept (providers such as iCloud drop sessions after 30 minutes)
+POOL_MAX_PER_ACCOUNT = 3
+POOL_MAX_IDLE_SECONDS = 25 * 60
+
+# Account fields a pooled connection is built from; a change in any of them retires it
+POOL_ACCOUNT_FIELDS = ('email', 'name', 'username', 'password', 'signature',
+                       'imap_server', 'imap_port', 'smtp_server', 'smtp_port')
+
+# Account fields the poller reads: the connection settings plus the mailbox sync state
+POLL_ACCOUNT_PROJECTION = {field: 1 for field in ('id', *POOL_ACCOUNT_FIELDS, 'last_uid', 'uidvalidity', 'highestmodseq')}
+
+# Concurrent IMAP fetches, overall and per server, so one provider isn't hit with
+# every account at once
+MAX_CONCURRENT_FETCHES = 32
+MAX_FETCHES_PER_HOST = 3
+
+# SMTP session reuse: recycle after this many messages or this long without a send
+SMTP_MAX_MESSAGES_PER_SESSION = 100
+SMTP_MAX_IDLE_SECONDS = 5 * 60
+
+# Timer polling: base interval, doubling per quiet cycle up to the cap, and how often
+# last_polled is refreshed for accounts whose polls found nothing
+POLL_INTERVAL = 60
+POLL_MAX_INTERVAL = 15 * 60
+LAST_POLLED_FLUSH_SECONDS = 60 * 60
+
+# Messages at least this large are parsed in a worker process instead of on the event loop
+PARSE_IN_PROCESS_MIN_BYTES = 64 * 1024
+
+# MongoDB error code for a unique index violation
+DUPLICATE_KEY_ERROR = 11000
+
+# Re-issue IDLE before the 30 minute inactivity limit servers are allowed to enforce
+IDLE_TIMEOUT = 29 * 60
+
 # EmailMessage will be imported from server to avoid duplication
 
+def strip_quoted_reply(body: str) -> str:
+    """Return only the new text of a reply, dropping the quoted thread and signature.
+    
+    A quote header found by _QUOTE_RE is cut with one regex search; anything else
+    (multi-line headers, ">" quoting without a header) goes through EmailReplyParser.
+    """
+    match = _QUOTE_RE.search(body)
+    if not match:
+        return EmailReplyParser.parse_reply(body)
+    reply = body[:match.start()]
+    signature = _SIGNATURE_RE.search(reply)
+    if signature:
+        reply = reply[:signature.start()]
+    return reply.strip()
+
+def materialize_raw_email(email_data: Dict[str, Any], account_email: str) -> Optional[Dict[str, Any]]:
+    """Fully parse a message returned by fetch_new_emails into the email data dict.
+    
+    A module-level function so large messages can be parsed in a worker process.
+    """
+    uid = email_data.get('uid')
+    try:
+        # Parse email
+        email_message = email.message_from_bytes(email_data['raw_bytes'])
+        
+        # Extract email details
+        subject = EmailConnection._decode_header(email_message.get('Subject', ''))
+        sender = EmailConnection._decode_header(email_message.get('From', ''))
+        recipient = EmailConnection._decode_header(email_message.get('To', ''))
+        date_str = email_message.get('Date', '')
+        message_id = email_data['message_id']
+        in_reply_to = email_message.get('In-Reply-To', '')
+        references = email_message.get('References', '')
+        
+        # Parse date
+        try:
+            received_at = email.utils.parsedate_to_datetime(date_str)
+        except:
+            received_at = datetime.utcnow()
+        
+        # Extract body and trim the quoted thread
+        body, body_html = EmailConnection._extract_body(email_message)
+        if body:
+            body = strip_quoted_reply(body)
+        
+        # Generate thread ID
+        thread_id = EmailConnection._generate_thread_id(message_id, in_reply_to, references, subject, account_email)
+        
+        return {
+            'uid': uid,
+            'message_id': message_id,
+            'thread_id': thread_id,
+            'subject': subject,
+            'sender': sender,
+            'recipient': recipient,
+            'body': body or '',
+            'body_html': body_html or '',
+            'received_at': received_at,
+            'in_reply_to': in_reply_to,
+            'references': references,
+            'account_id': email_data['account_id']
+        }
+        
+    except Exception as e:
+        logger.error(f"❌ Error parsing email UID {uid}: {str(e)}")
+        return None
+
+
 class EmailConnection:
     """Handles IMAP and SMTP connections for an email account"""
     
@@ -38,8 +185,18 @@ class EmailConnection:
         self.smtp_port = account_config['smtp_port']
         
         self.imap_connection = None
+        self.idling = False
+        
+        # Persistent SMTP session, shared by threads sending through this connection
+        self.smtp_connection = None
+        self.smtp_sent_count = 0
+        self.smtp_last_used = 0.0
+        self.smtp_lock = threading.Lock()
         self.last_uid = account_config.get('last_uid', 0)
         self.uidvalidity = account_config.get('uidvalidity', None)
+        self.highestmodseq = account_config.get('highestmodseq', None)
+        self.capabilities = set()
+        self.condstore = False
         
     def _is_connection_healthy(self) -> bool:
         """Check if IMAP connection is healthy and ready to use"""
@@ -66,8 +223,13 @@ class EmailConnection:
             self.imap_connection = imaplib.IMAP4_SSL(self.imap_server, self.imap_port, ssl_context=context)
             self.imap_connection.login(self.username, self.password)
             
-            # Select INBOX
+            # Capabilities can change after login, so read them again
+            self.capabilities = self._read_capabilities()
+            self.condstore = self._enable_condstore()
+            
+            # Select INBOX and read UIDVALIDITY from its response
             self.imap_connection.select('INBOX')
+            self._check_uidvalidity()
             
             logger.info(f"✅ IMAP connected for {self.email}")
             return True
@@ -77,6 +239,50 @@ class EmailConnection:
             self.imap_connection = None
             return False
     
+    def close(self):
+        """Close every server connection held by this object"""
+        self.disconnect_imap()
+        self.disconnect_smtp()
+    
+    def disconnect_smtp(self):
+        """Drop the SMTP session without waiting on a QUIT round-trip"""
+        if self.smtp_connection:
+            try:
+                self.smtp_connection.close()
+            except Exception:
+                pass
+            self.smtp_connection = None
+    
+    def _smtp_session(self) -> smtplib.SMTP:
+        """Return a logged-in SMTP session, reusing the open one while it is fresh and alive.
+        
+        Callers must hold smtp_lock.
+        """
+        if self.smtp_connection:
+            is_fresh = (self.smtp_sent_count < SMTP_MAX_MESSAGES_PER_SESSION and
+                        time.monotonic() - self.smtp_last_used < SMTP_MAX_IDLE_SECONDS)
+            if is_fresh:
+                try:
+                    # RSET clears any half-finished transaction and proves the session is alive
+                    self.smtp_connection.rset()
+                    return self.smtp_connection
+                except (smtplib.SMTPException, OSError):
+                    logger.debug(f"🔄 SMTP session for {self.email} went stale, reconnecting")
+            self.disconnect_smtp()
+        
+        context = ssl.create_default_context()
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            server.starttls(context=context)
+            server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        
+        self.smtp_connection = server
+        self.smtp_sent_count = 0
+        return server
+    
     def disconnect_imap(self):
         """Disconnect from IMAP server"""
         if self.imap_connection:
@@ -87,6 +293,116 @@ class EmailConnection:
                 pass
             self.imap_connection = None
     
+    def _check_uidvalidity(self):
+        """Compare the UIDVALIDITY from the SELECT response with the stored one"""
+        try:
+            typ, data = self.imap_connection.response('UIDVALIDITY')
+            if data and data[0]:
+                current_uidvalidity = data[0].decode() if isinstance(data[0], bytes) else str(data[0])
+                if self.uidvalidity and self.uidvalidity != current_uidvalidity:
+                    # UIDVALIDITY changed, reset last_uid
+                    logger.warning(f"UIDVALIDITY changed for {self.email}, resetting UID tracking")
+                    self.last_uid = 0
+                    self.highestmodseq = None
+                self.uidvalidity = current_uidvalidity
+        except Exception as uidvalidity_error:
+            logger.warning(f"⚠️  Could not parse UIDVALIDITY for {self.email}: {uidvalidity_error}")
+    
+    def _read_capabilities(self) -> set:
+        """Read the server's capabilities for the authenticated session"""
+        try:
+            typ, data = self.imap_connection.capability()
+            if typ == 'OK' and data and data[0]:
+                capabilities = set(data[0].decode().upper().split())
+                self.imap_connection.capabilities = tuple(capabilities)
+                return capabilities
+        except Exception as e:
+            logger.warning(f"⚠️  Could not read IMAP capabilities for {self.email}: {str(e)}")
+        return set()
+    
+    def _enable_condstore(self) -> bool:
+        """Turn on CONDSTORE so searches can skip messages unchanged since the last poll"""
+        if 'CONDSTORE' not in self.capabilities or 'ENABLE' not in self.capabilities:
+            return False
+        try:
+            typ, _ = self.imap_connection.enable('CONDSTORE')
+            return typ == 'OK'
+        except Exception as e:
+            logger.warning(f"⚠️  Could not enable CONDSTORE for {self.email}: {str(e)}")
+            return False
+    
+    def supports_idle(self) -> bool:
+        """Check whether the connected server advertises the IDLE extension"""
+        return 'IDLE' in self.capabilities
+    
+    def idle_wait(self, timeout: float = IDLE_TIMEOUT) -> bool:
+        """Block in IMAP IDLE until the server reports new mail or the timeout passes.
+        
+        Returns True when new mail arrived; the connection stays open for the next IDLE.
+        On timeout or error the connection is closed, since imaplib's socket file cannot
+        be read again after a timeout.
+        """
+        conn = self.imap_connection
+        tag = conn._new_tag()
+        self.idling = True
+        try:
+            conn.send(tag + b' IDLE\r\n')
+            line = conn.readline()
+            if not line.startswith(b'+'):
+                raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+            
+            # Wait for an untagged EXISTS/RECENT update
+            conn.sock.settimeout(timeout)
+            while True:
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                if line.startswith(b'*') and (b'EXISTS' in line or b'RECENT' in line):
+                    break
+            conn.sock.settimeout(None)
+            
+            # Leave IDLE and drain up to its tagged completion
+            conn.send(b'DONE\r\n')
+            while True:
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed while leaving IDLE")
+                if line.startswith(tag):
+                    break
+            return True
+        except socket.timeout:
+            logger.debug(f"⏰ IDLE period ended without new mail for {self.email}")
+            self._close_imap_socket()
+            return False
+        except Exception:
+            self._close_imap_socket()
+            raise
+        finally:
+            self.idling = False
+            conn.tagged_commands.pop(tag, None)
+    
+    def abort_idle(self):
+        """Stop a blocking idle_wait() from another thread by shutting the socket down"""
+        conn = self.imap_connection
+        if not conn:
+            return
+        try:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if not self.idling:
+            # No thread is reading the socket, so close it here; otherwise idle_wait() does
+            self._close_imap_socket()
+    
+    def _close_imap_socket(self):
+        """Close the IMAP socket without a LOGOUT exchange"""
+        if self.imap_connection:
+            try:
+                self.imap_connection.shutdown()
+            except Exception:
+                pass
+            self.imap_connection = None
+    
     def fetch_new_emails(self) -> List[Dict[str, Any]]:
         """Fetch new emails from IMAP server"""
         # Check if connection exists and is healthy
@@ -107,24 +423,11 @@ class EmailConnection:
                 if not self.connect_imap():
                     return []
             
-            # Check UIDVALIDITY for this mailbox
-            try:
-                response = self.imap_connection.response('UIDVALIDITY')
-                if response and response[1] and response[1][0]:
-                    current_uidvalidity = response[1][0].decode() if isinstance(response[1][0], bytes) else str(response[1][0])
-                    if self.uidvalidity and self.uidvalidity != current_uidvalidity:
-                        # UIDVALIDITY changed, reset last_uid
-                        logger.warning(f"UIDVALIDITY changed for {self.email}, resetting UID tracking")
-                        self.last_uid = 0
-                    self.uidvalidity = current_uidvalidity
-            except Exception as uidvalidity_error:
-                logger.warning(f"⚠️  Could not parse UIDVALIDITY for {self.email}: {uidvalidity_error}")
-                pass  # Continue without UIDVALIDITY checking
-            
             # Search for messages newer than last processed UID
+            searched_modseq = None
             if self.last_uid > 0:
                 # Search for UIDs greater than last processed
-                typ, msg_ids = self.imap_connection.uid('search', None, f'UID {self.last_uid+1}:*')
+                typ, msg_ids, searched_modseq = self._search_new_uids()
             else:
                 # First time polling - get the latest UID to start from (don't process existing emails)
                 typ, all_msg_ids = self.imap_connection.uid('search', None, 'ALL')
@@ -143,23 +446,32 @@ class EmailConnection:
             if typ != 'OK' or not msg_ids[0]:
                 return []
             
-            # Split and filter out empty UIDs
-            uids = [uid for uid in msg_ids[0].split() if uid]
-            new_emails = []
-            
-            for uid in uids:
+            # Split and filter out empty and already processed UIDs
+            uids = []
+            for uid in msg_ids[0].split():
+                if not uid:
+                    continue
                 try:
-                    uid_int = int(uid.decode())
-                    if uid_int <= self.last_uid:
-                        continue
-                        
-                    email_data = self._fetch_email_by_uid(uid)
-                    if email_data:
-                        new_emails.append(email_data)
-                        self.last_uid = max(self.last_uid, uid_int)
+                    if int(uid.decode()) > self.last_uid:
+                        uids.append(uid)
                 except (ValueError, UnicodeDecodeError) as decode_error:
                     logger.warning(f"⚠️  Skipping invalid UID for {self.email}: {uid} - {decode_error}")
-                    continue
+            
+            # Fetch in batches - one UID FETCH per chunk instead of one per message. Stop at
+            # the first failed chunk, so last_uid never moves past messages not yet fetched
+            new_emails = []
+            for chunk in self._chunk_uids(uids):
+                batch = self._fetch_email_batch(chunk)
+                if batch is None:
+                    break
+                for email_data in batch:
+                    new_emails.append(email_data)
+                    self.last_uid = max(self.last_uid, email_data['uid'])
+            
+            # Only move the MODSEQ floor once every searched message was fetched, so a failed
+            # fetch is retried on the next poll
+            if searched_modseq and uids and self.last_uid >= int(uids[-1].decode()):
+                self.highestmodseq = max(self.highestmodseq or 0, searched_modseq)
             
             logger.info(f"📧 Fetched {len(new_emails)} new emails for {self.email}")
             return new_emails
@@ -169,54 +481,111 @@ class EmailConnection:
             self.disconnect_imap()
             return []
     
-    def _fetch_email_by_uid(self, uid) -> Optional[Dict[str, Any]]:
-        """Fetch a single email by UID"""
+    def _search_new_uids(self):
+        """UID SEARCH for messages after last_uid; returns (typ, data, highest MODSEQ or None).
+        
+        With CONDSTORE the search is also limited to messages modified after the stored
+        mod-sequence, and the server reports the highest mod-sequence it matched.
+        """
+        criteria = f'UID {self.last_uid+1}:*'
+        if self.condstore:
+            try:
+                typ, data = self.imap_connection.uid('search', None, f'MODSEQ {(self.highestmodseq or 0) + 1}', criteria)
+                if typ == 'OK':
+                    result = data[0] or b''
+                    match = _SEARCH_MODSEQ_RE.search(result)
+                    if match:
+                        return typ, [result[:match.start()].strip()], int(match.group(1))
+                    return typ, [result], None
+            except imaplib.IMAP4.error as e:
+                logger.warning(f"⚠️  CONDSTORE search failed for {self.email}, using plain UID search: {str(e)}")
+                self.condstore = False
+        
+        typ, data = self.imap_connection.uid('search', None, criteria)
+        return typ, data, None
+    
+    @staticmethod
+    def _chunk_uids(uids: List[bytes]):
+        """Split UIDs into FETCH-sized chunks, bounded by count and by command length"""
+        chunk = []
+        chunk_bytes = 0
+        for uid in uids:
+            if chunk and (len(chunk) >= FETCH_BATCH_SIZE or chunk_bytes + len(uid) + 1 > FETCH_BATCH_MAX_BYTES):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(uid)
+            chunk_bytes += len(uid) + 1
+        if chunk:
+            yield chunk
+    
+    def _fetch_email_batch(self, uids: List[bytes]) -> Optional[List[Dict[str, Any]]]:
+        """Fetch several emails with a single UID FETCH, returned in UID order; None if the FETCH failed"""
         try:
-            # Fetch email data
-            typ, msg_data = self.imap_connection.uid('fetch', uid, '(RFC822)')
-            if typ != 'OK' or not msg_data[0]:
+            uid_set = b','.join(uids).decode()
+            typ, msg_data = self.imap_connection.uid('fetch', uid_set, FETCH_ITEMS)
+            if typ != 'OK':
+                logger.error(f"❌ UID FETCH {uids[0].decode()}..{uids[-1].decode()} for {self.email} returned {typ}")
                 return None
+            if not msg_data:
+                return []
+        except Exception as e:
+            logger.error(f"❌ Error fetching UIDs {uids[0].decode()}..{uids[-1].decode()} for {self.email}: {str(e)}")
+            return None
+        
+        # Each message arrives as one (envelope, literal) tuple per section, then the closing
+        # bytes of its item list. Servers may order the items freely, including reporting
+        # the UID after the literals.
+        messages = []
+        current = None
+        for item in msg_data:
+            if isinstance(item, tuple):
+                envelope, literal = item
+            elif isinstance(item, bytes):
+                envelope, literal = item, None
+            else:
+                continue
             
-            # Parse email
-            email_message = email.message_from_bytes(msg_data[0][1])
-            
-            # Extract email details
-            subject = self._decode_header(email_message.get('Subject', ''))
-            sender = self._decode_header(email_message.get('From', ''))
-            recipient = self._decode_header(email_message.get('To', ''))
-            date_str = email_message.get('Date', '')
-            message_id = email_message.get('Message-ID', '')
-            in_reply_to = email_message.get('In-Reply-To', '')
-            references = email_message.get('References', '')
-            
-            # Parse date
-            try:
-                received_at = email.utils.parsedate_to_datetime(date_str)
-            except:
-                received_at = datetime.utcnow()
-            
-            # Extract body
-            body, body_html = self._extract_body(email_message)
-            
-            # Clean body using email reply parser
-            if body:
-                body = EmailReplyParser.parse_reply(body)
+            if _FETCH_START_RE.match(envelope):
+                current = {'uid': None, 'size': None, 'HEADER': b'', 'TEXT': b''}
+                messages.append(current)
+            if current is None:
+                continue
+            if literal is not None:
+                section = _FETCH_SECTION_RE.search(envelope)
+                if section:
+                    current[section.group(1).decode()] = literal
             
-            # Generate thread ID
-            thread_id = self._generate_thread_id(message_id, in_reply_to, references, subject)
+            uid_match = _FETCH_UID_RE.search(envelope)
+            if uid_match and current['uid'] is None:
+                current['uid'] = int(uid_match.group(1))
+            size_match = _FETCH_SIZE_RE.search(envelope)
+            if size_match and current['size'] is None:
+                current['size'] = int(size_match.group(1))
+        
+        emails = []
+        for message in sorted((m for m in messages if m['uid'] is not None and m['HEADER']), key=lambda m: m['uid']):
+            if message['size'] and message['size'] > len(message['HEADER']) + FETCH_TEXT_MAX_BYTES:
+                logger.debug(f"✂️  UID {message['uid']} for {self.email} is {message['size']} bytes, body truncated to text parts")
+            email_data = self._parse_email_bytes(message['uid'], message['HEADER'] + message['TEXT'])
+            if email_data:
+                emails.append(email_data)
+        return emails
+    
+    def _fetch_email_by_uid(self, uid) -> Optional[Dict[str, Any]]:
+        """Fetch a single email by UID"""
+        emails = self._fetch_email_batch([uid])
+        return emails[0] if emails else None
+    
+    def _parse_email_bytes(self, uid: int, raw_email: bytes) -> Optional[Dict[str, Any]]:
+        """Read just the Message-ID from a raw message; the rest waits for materialize_email"""
+        try:
+            headers = HEADER_PARSER.parsebytes(raw_email)
             
             return {
-                'uid': int(uid.decode()),
-                'message_id': message_id,
-                'thread_id': thread_id,
-                'subject': subject,
-                'sender': sender,
-                'recipient': recipient,
-                'body': body or '',
-                'body_html': body_html or '',
-                'received_at': received_at,
-                'in_reply_to': in_reply_to,
-                'references': references,
+                'uid': uid,
+                'message_id': headers.get('Message-ID', ''),
+                'raw_bytes': raw_email,
                 'account_id': self.account_id
             }
             
@@ -224,11 +593,20 @@ class EmailConnection:
             logger.error(f"❌ Error parsing email UID {uid}: {str(e)}")
             return None
     
-    def _decode_header(self, header_value: str) -> str:
+    def materialize_email(self, email_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Fully parse a message returned by fetch_new_emails into the email data dict"""
+        return materialize_raw_email(email_data, self.email)
+    
+    @staticmethod
+    def _decode_header(header_value: str) -> str:
         """Decode email header value"""
         if not header_value:
             return ''
         
+        # Plain headers have no RFC 2047 encoded words and need no decoding
+        if '=?' not in header_value:
+            return header_value
+        
         try:
             decoded_parts = decode_header(header_value)
             decoded_string = ''
@@ -244,7 +622,8 @@ class EmailConnection:
         except:
             return header_value
     
-    def _extract_body(self, email_message) -> Tuple[Optional[str], Optional[str]]:
+    @staticmethod
+    def _extract_body(email_message) -> Tuple[Optional[str], Optional[str]]:
         """Extract plain text and HTML body from email"""
         body = None
         body_html = None
@@ -252,10 +631,13 @@ class EmailConnection:
         if email_message.is_multipart():
             for part in email_message.walk():
                 content_type = part.get_content_type()
-                content_disposition = str(part.get("Content-Disposition"))
+                
+                # Only text parts are ever decoded; containers and binary parts are skipped as-is
+                if content_type not in ("text/plain", "text/html"):
+                    continue
                 
                 # Skip attachments
-                if "attachment" in content_disposition:
+                if "attachment" in str(part.get("Content-Disposition")):
                     continue
                 
                 if content_type == "text/plain" and not body:
@@ -270,6 +652,10 @@ class EmailConnection:
                         body_html = part.get_payload(decode=True).decode(charset, errors='ignore')
                     except:
                         pass
+                
+                # Stop walking once both bodies are in hand
+                if body and body_html:
+                    break
         else:
             # Single part message
             content_type = email_message.get_content_type()
@@ -286,7 +672,9 @@ class EmailConnection:
         
         return body, body_html
     
-    def _generate_thread_id(self, message_id: str, in_reply_to: str, references: str, subject: str) -> str:
+    @staticmethod
+    def _generate_thread_id(message_id: str, in_reply_to: str, references: str, subject: str,
+                            account_email: str) -> str:
         """Generate thread ID for email conversation tracking"""
         # If this is a reply, use the original message ID from In-Reply-To or References
         if in_reply_to:
@@ -299,25 +687,31 @@ class EmailConnection:
                 return ref_ids[0].strip('<>')
         
         # Clean subject for thread matching
-        clean_subject = re.sub(r'^(re:|fwd?:)\s*', '', subject.lower().strip())
-        thread_hash = str(hash(f"{clean_subject}_{self.email}"))
+        clean_subject = _SUBJECT_PREFIX_RE.sub('', subject.strip()).lower()
+        # blake2b rather than hash(), which is salted per process and changes on restart
+        thread_hash = hashlib.blake2b(f"{clean_subject}_{account_email}".encode(), digest_size=8).hexdigest()
         
         return f"thread-{thread_hash}"
     
     def mark_email_as_read(self, uid: int) -> bool:
         """Mark email as read by UID"""
+        return self.mark_emails_as_read([uid])
+    
+    def mark_emails_as_read(self, uids: List[int]) -> bool:
+        """Mark emails as read with one UID STORE per FETCH-sized chunk of UIDs"""
         try:
             if not self.imap_connection:
                 if not self.connect_imap():
                     return False
             
             # Mark as seen (read)
-            self.imap_connection.uid('store', str(uid), '+FLAGS', '(\\Seen)')
-            logger.info(f"📖 Marked email UID {uid} as read for {self.email}")
+            for chunk in self._chunk_uids([str(uid).encode() for uid in uids]):
+                self.imap_connection.uid('store', b','.join(chunk).decode(), '+FLAGS', '(\\Seen)')
+            logger.info(f"📖 Marked {len(uids)} emails as read for {self.email}")
             return True
             
         except Exception as e:
-            logger.error(f"❌ Error marking email UID {uid} as read for {self.email}: {str(e)}")
+            logger.error(f"❌ Error marking UIDs {uids} as read for {self.email}: {str(e)}")
             return False
     
     def send_email(self, to_email: str, subject: str, body: str, body_html: str = None, 
@@ -362,12 +756,16 @@ class EmailConnection:
                 if body_html:
                     body_html += f"<br><br>{signature.replace(chr(10), '<br>')}"
             
-            # Connect to SMTP and send
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.username, self.password)
-                server.send_message(msg)
+            # Send over the persistent SMTP session, opening one if needed
+            with self.smtp_lock:
+                try:
+                    server = self._smtp_session()
+                    server.send_message(msg)
+                except Exception:
+                    self.disconnect_smtp()
+                    raise
+                self.smtp_sent_count += 1
+                self.smtp_last_used = time.monotonic()
             
             logger.info(f"✅ Email sent from {self.email} to {to_email}")
             return True
@@ -377,19 +775,96 @@ class EmailConnection:
             return False
 
 
+class EmailConnectionPool:
+    """Per-account pool of EmailConnection objects, bounding concurrent connections per account"""
+    
+    def __init__(self, max_per_account: int = POOL_MAX_PER_ACCOUNT, max_idle_seconds: float = POOL_MAX_IDLE_SECONDS):
+        self.max_per_account = max_per_account
+        self.max_idle_seconds = max_idle_seconds
+        self._semaphores = {}
+        self._idle = {}
+    
+    @staticmethod
+    def _account_key(account: Dict[str, Any]) -> tuple:
+        return tuple(account.get(field) for field in POOL_ACCOUNT_FIELDS)
+    
+    @asynccontextmanager
+    async def acquire(self, account: Dict[str, Any]):
+        """Borrow a connection for the account, reusing an idle one when it is still fresh"""
+        account_id = account['id']
+        semaphore = self._semaphores.get(account_id)
+        if semaphore is None:
+            semaphore = self._semaphores[account_id] = asyncio.Semaphore(self.max_per_account)
+        
+        async with semaphore:
+            key = self._account_key(account)
+            connection = self._checkout(account_id, key) or EmailConnection(account)
+            try:
+                yield connection
+            finally:
+                self._idle.setdefault(account_id, deque()).append((connection, key, time.monotonic()))
+    
+    def _checkout(self, account_id: str, key: tuple) -> Optional['EmailConnection']:
+        """Take the most recently used idle connection, closing stale or outdated ones"""
+        idle = self._idle.get(account_id)
+        now = time.monotonic()
+        while idle:
+            connection, connection_key, last_used = idle.pop()
+            if connection_key == key and now - last_used < self.max_idle_seconds:
+                return connection
+            connection.close()
+        return None
+    
+    def invalidate(self, account_id: str):
+        """Close and forget all idle connections for an account"""
+        for connection, _, _ in self._idle.pop(account_id, ()):
+            connection.close()
+    
+    def close_all(self):
+        """Close every idle connection"""
+        for account_id in list(self._idle):
+            self.invalidate(account_id)
+
+
 class EmailPollingService:
     """Service to poll email accounts and process new messages"""
     
     def __init__(self, mongo_url: str, db_name: str):
-        self.client = AsyncIOMotorClient(mongo_url)
+        self.client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=3000, compressors='zstd,zlib')
         self.db = self.client[db_name]
         self.is_running = False
         self.connections = {}
+        # Per-account IMAP IDLE sessions; accounts with a live session are not polled on the timer
+        self.idle_tasks = {}
+        self.idle_connections = {}
+        self.idle_unsupported = set()
+        self.fetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+        self.host_semaphores = {}
+        self._server = None
+        # Quiet-inbox back-off, the active account ids it was measured over, and a wake-up
+        # for account changes made while the loop sleeps
+        self.empty_streak = 0
+        self.active_account_ids = set()
+        self.wake_event = asyncio.Event()
+        # Sync state last written per account, and accounts polled successfully since the
+        # last periodic last_polled refresh
+        self.saved_sync_state = {}
+        self.polled_ok = set()
+        self.last_polled_flushed = 0.0
+        # Worker processes for parsing large messages, started on first use
+        self.parse_pool = None
         
+    def _lazy_server(self):
+        """Return the server module, imported on first use to avoid a circular import"""
+        if self._server is None:
+            self._server = importlib.import_module('server')
+        return self._server
+    
     async def start_polling(self):
         """Start the email polling service"""
         self.is_running = True
         logger.info("🚀 Starting email polling service...")
+        await self._ensure_indexes()
         
         poll_count = 0
         while self.is_running:
@@ -397,81 +872,151 @@ class EmailPollingService:
                 poll_count += 1
                 logger.info(f"🔄 Starting poll cycle #{poll_count}")
                 
-                await self._poll_all_accounts()
+                had_new_mail = await self._poll_all_accounts()
+                
+                # Refresh last_polled at most once per interval, for the accounts whose polls
+                # succeeded; individual polls only write when the mailbox sync state moves
+                if self.polled_ok and time.monotonic() - self.last_polled_flushed >= LAST_POLLED_FLUSH_SECONDS:
+                    await self.db.email_accounts.update_many(
+                        {"id": {"$in": list(self.polled_ok)}},
+                        {"$currentDate": {"last_polled": True}}
+                    )
+                    self.polled_ok.clear()
+                    self.last_polled_flushed = time.monotonic()
                 
-                logger.info(f"✅ Poll cycle #{poll_count} completed. Active connections: {len(self.connections)}")
-                await asyncio.sleep(60)  # Poll every 60 seconds
+                # Back off while every inbox stays quiet; new mail or a change in the set of
+                # active accounts resets to the base interval
+                self.empty_streak = 0 if had_new_mail else self.empty_streak + 1
+                delay = min(POLL_INTERVAL * 2 ** min(self.empty_streak, 4), POLL_MAX_INTERVAL)
+                
+                logger.info(f"✅ Poll cycle #{poll_count} completed. Active connections: {len(self.connections)}, next poll in {delay}s")
+                try:
+                    await asyncio.wait_for(self.wake_event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wake_event.clear()
                 
             except Exception as e:
                 logger.error(f"❌ Error in polling loop (cycle #{poll_count}): {str(e)}")
                 # Continue running even if one cycle fails
-                await asyncio.sleep(60)
+                await asyncio.sleep(POLL_INTERVAL)
+    
+    async def _ensure_indexes(self):
+        """Create the unique index that duplicate detection on insert relies on"""
+        try:
+            await self.db.emails.create_index([("message_id", 1), ("account_id", 1)], unique=True)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not create unique email index (existing duplicates?): {str(e)}")
     
     def stop_polling(self):
         """Stop the email polling service"""
         self.is_running = False
+        for account_id in list(self.idle_tasks):
+            self.stop_idle(account_id)
         for connection in self.connections.values():
             connection.disconnect_imap()
         self.connections.clear()
+        connection_pool.close_all()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+            self.parse_pool = None
         logger.info("🛑 Email polling service stopped")
     
-    async def _poll_all_accounts(self):
-        """Poll all active email accounts"""
+    def accounts_changed(self):
+        """Poll again right away at the base interval, e.g. after an account is added or reactivated"""
+        self.empty_streak = 0
+        self.wake_event.set()
+    
+    async def _poll_all_accounts(self) -> bool:
+        """Poll all active email accounts.
+        
+        Returns whether the next cycle should come at the base interval: some account had
+        new mail, or the set of active accounts changed since the previous cycle.
+        """
         try:
-            # Get all active email accounts
-            accounts = await self.db.email_accounts.find({"is_active": True}).to_list(100)
+            # Stream all active email accounts, starting each poll as its account arrives.
+            # Accounts with a live IDLE session fetch as soon as mail arrives; poll the rest
+            accounts = []
+            tasks = []
+            active_account_ids = set()
+            async for account in self.db.email_accounts.find({"is_active": True}, POLL_ACCOUNT_PROJECTION):
+                active_account_ids.add(account['id'])
+                if account['id'] in self.idle_tasks:
+                    continue
+                accounts.append(account)
+                tasks.append(asyncio.create_task(self._poll_account(account)))
+            
+            # IMAP work runs in worker threads, so accounts can be polled side by side;
+            # _poll_account handles its own errors, this only keeps one from cancelling the rest
+            results = await asyncio.gather(*tasks, return_exceptions=True)
             
+            # Move accounts that polled cleanly over to IDLE where the server supports it
             for account in accounts:
-                await self._poll_account(account)
+                if account['id'] in self.connections and account['id'] not in self.idle_unsupported:
+                    self._start_idle(account)
+            
+            accounts_changed = active_account_ids != self.active_account_ids
+            self.active_account_ids = active_account_ids
+            self.polled_ok &= active_account_ids
+            
+            return accounts_changed or any(isinstance(result, int) and result > 0 for result in results)
                 
         except Exception as e:
             logger.error(f"❌ Error polling accounts: {str(e)}")
+            return False
     
-    async def _poll_account(self, account: Dict[str, Any]):
-        """Poll a single email account"""
+    async def _poll_account(self, account: Dict[str, Any]) -> int:
+        """Poll a single email account; returns the number of new emails fetched"""
         account_id = account['id']
         
         try:
-            # Get or create connection
+            # Get or create connection. A new connection starts from the account document's
+            # last_uid/uidvalidity; after that it is the only writer, so its state is authoritative
             if account_id not in self.connections:
                 logger.info(f"🔌 Creating new connection for {account.get('email', account_id)}")
                 self.connections[account_id] = EmailConnection(account)
+                self.saved_sync_state.pop(account_id, None)
             else:
                 logger.debug(f"🔄 Reusing existing connection for {account.get('email', account_id)}")
             
             connection = self.connections[account_id]
             
-            # Update connection with latest account data from database
-            # This ensures we have the most recent last_uid and uidvalidity
-            latest_account = await self.db.email_accounts.find_one({"id": account_id})
-            if latest_account:
-                connection.last_uid = latest_account.get('last_uid', 0)
-                connection.uidvalidity = latest_account.get('uidvalidity', None)
-                logger.debug(f"🔄 Updated connection last_uid to {connection.last_uid} for {connection.email}")
-            
-            # Fetch new emails - connection will be validated/recreated if needed
-            new_emails = connection.fetch_new_emails()
-            
-            # Always update last UID and last_polled in database (even if no new emails)
-            await self.db.email_accounts.update_one(
-                {"id": account_id},
-                {"$set": {
-                    "last_uid": connection.last_uid,
-                    "uidvalidity": connection.uidvalidity,
-                    "last_polled": datetime.utcnow()
-                }}
-            )
+            # Fetch new emails - connection will be validated/recreated if needed.
+            # imaplib blocks, so run it off the event loop, within the global and per-host limits
+            host = connection.imap_server
+            host_semaphore = self.host_semaphores.get(host)
+            if host_semaphore is None:
+                host_semaphore = self.host_semaphores[host] = asyncio.Semaphore(MAX_FETCHES_PER_HOST)
+            async with self.fetch_semaphore, host_semaphore:
+                new_emails = await asyncio.to_thread(connection.fetch_new_emails)
+            
+            # Update last UID and last_polled in database on a new connection or when the
+            # sync state moved; quiet polls are covered by the periodic last_polled refresh
+            sync_state = (connection.last_uid, connection.uidvalidity, connection.highestmodseq)
+            if self.saved_sync_state.get(account_id) != sync_state:
+                await self.db.email_accounts.update_one(
+                    {"id": account_id},
+                    {"$set": {
+                        "last_uid": connection.last_uid,
+                        "uidvalidity": connection.uidvalidity,
+                        "highestmodseq": connection.highestmodseq,
+                        "last_polled": datetime.utcnow()
+                    }}
+                )
+                self.saved_sync_state[account_id] = sync_state
+            self.polled_ok.add(account_id)
             
             if new_emails:
                 logger.info(f"📥 Processing {len(new_emails)} new emails for {connection.email}")
-                # Process each new email
-                for email_data in new_emails:
-                    await self._process_new_email(email_data)
+                await self._process_new_emails(new_emails, connection)
             else:
                 logger.debug(f"📭 No new emails for {connection.email}")
+            
+            return len(new_emails)
                 
         except Exception as e:
             logger.error(f"❌ Error polling account {account.get('email', account_id)}: {str(e)}")
+            self.polled_ok.discard(account_id)
             # Remove connection on error to force reconnect on next poll
             if account_id in self.connections:
                 try:
@@ -480,65 +1025,166 @@ class EmailPollingService:
                     logger.warning(f"⚠️  Error disconnecting IMAP for {account.get('email', account_id)}: {disconnect_error}")
                 del self.connections[account_id]
                 logger.info(f"🔌 Removed unhealthy connection for {account.get('email', account_id)}")
+            return 0
+    
+    def _start_idle(self, account: Dict[str, Any]):
+        """Start the IDLE session task for an account"""
+        self.idle_tasks[account['id']] = asyncio.create_task(self._idle_loop(account))
+    
+    def stop_idle(self, account_id: str):
+        """Stop an account's IDLE session; the account goes back to timer polling"""
+        task = self.idle_tasks.pop(account_id, None)
+        if task:
+            task.cancel()
+        idle_connection = self.idle_connections.pop(account_id, None)
+        if idle_connection:
+            idle_connection.abort_idle()
     
-    async def _process_new_email(self, email_data: Dict[str, Any]):
-        """Process a new email through the AI workflow"""
+    async def _idle_loop(self, account: Dict[str, Any]):
+        """Wait in IMAP IDLE on a dedicated connection and fetch whenever the server signals new mail.
+        
+        Each IDLE period also ends with a fetch, which catches anything missed while reconnecting.
+        The loop exits on errors or deactivation, returning the account to timer polling.
+        
+        The blocking IDLE wait runs on a thread of its own rather than the shared default
+        executor: it holds its thread for up to IDLE_TIMEOUT, and enough idling accounts would
+        otherwise starve every other asyncio.to_thread call (fetches, mark-as-read, SMTP sends).
+        """
+        account_id = account['id']
+        account_email = account.get('email', account_id)
+        idle_connection = EmailConnection(account)
+        self.idle_connections[account_id] = idle_connection
+        idle_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"imap-idle-{account_id}")
+        loop = asyncio.get_running_loop()
+        
         try:
-            # Check for duplicates
-            existing = await self.db.emails.find_one({
-                "message_id": email_data['message_id'],
-                "account_id": email_data['account_id']
-            })
-            
-            if existing:
-                return  # Skip duplicate
-            
-            # Import EmailMessage dynamically to avoid circular imports
-            from server import EmailMessage
-            
-            # Create email record
-            email_obj = EmailMessage(
-                account_id=email_data['account_id'],
-                message_id=email_data['message_id'],
-                thread_id=email_data['thread_id'],
-                subject=email_data['subject'],
-                sender=email_data['sender'],
-                recipient=email_data['recipient'],
-                body=email_data['body'],
-                body_html=email_data['body_html'],
-                received_at=email_data['received_at'],
-                status="new"
-            )
+            while self.is_running:
+                if not idle_connection.imap_connection:
+                    if not await loop.run_in_executor(idle_executor, idle_connection.connect_imap):
+                        break
+                    if not idle_connection.supports_idle():
+                        logger.info(f"📭 IMAP IDLE not supported for {account_email}, staying on polling")
+                        self.idle_unsupported.add(account_id)
+                        break
+                
+                has_new_mail = await loop.run_in_executor(idle_executor, idle_connection.idle_wait, IDLE_TIMEOUT)
+                if has_new_mail:
+                    logger.info(f"🔔 IDLE reported new mail for {account_email}")
+                
+                account = await self.db.email_accounts.find_one({"id": account_id, "is_active": True}, POLL_ACCOUNT_PROJECTION)
+                if not account:
+                    break
+                await self._poll_account(account)
+                
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️  IDLE session ended for {account_email}, falling back to polling: {str(e)}")
+        finally:
+            if self.idle_connections.get(account_id) is idle_connection:
+                del self.idle_connections[account_id]
+            if self.idle_tasks.get(account_id) is asyncio.current_task():
+                del self.idle_tasks[account_id]
+            idle_connection.abort_idle()
+            idle_executor.shutdown(wait=False)
+    
+    async def _materialize_email(self, email_data: Dict[str, Any], connection: EmailConnection) -> Optional[Dict[str, Any]]:
+        """Parse a fetched message, in a worker process when it is large enough to hold up the event loop"""
+        if len(email_data['raw_bytes']) < PARSE_IN_PROCESS_MIN_BYTES:
+            return connection.materialize_email(email_data)
+        
+        if self.parse_pool is None:
+            self.parse_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.parse_pool, materialize_raw_email, email_data, connection.email)
+    
+    async def _process_new_emails(self, new_emails: List[Dict[str, Any]], connection: EmailConnection):
+        """Store one poll's new emails in a single bulk write and start the AI workflow for each"""
+        try:
+            account_id = connection.account_id
+            
+            # Check for duplicates in one query
+            existing = set(await self.db.emails.distinct("message_id", {
+                "account_id": account_id,
+                "message_id": {"$in": [email_data['message_id'] for email_data in new_emails]}
+            }))
+            
+            EmailMessage = self._lazy_server().EmailMessage
+            
+            kept_emails = []
+            for email_data in new_emails:
+                if email_data['message_id'] in existing:
+                    continue  # Skip duplicate
+                existing.add(email_data['message_id'])
+                kept_emails.append(email_data)
+            
+            # Decode headers and body only now that we know the emails will be kept
+            parsed_emails = await asyncio.gather(*(
+                self._materialize_email(email_data, connection) for email_data in kept_emails
+            ))
             
-            # Store in database
-            await self.db.emails.insert_one(email_obj.dict())
+            email_objs = []
+            uids = []
+            for email_data in parsed_emails:
+                if email_data is None:
+                    continue
+                
+                email_objs.append(EmailMessage(
+                    account_id=email_data['account_id'],
+                    message_id=email_data['message_id'],
+                    thread_id=email_data['thread_id'],
+                    subject=email_data['subject'],
+                    sender=email_data['sender'],
+                    recipient=email_data['recipient'],
+                    body=email_data['body'],
+                    body_html=email_data['body_html'],
+                    received_at=email_data['received_at'],
+                    status="new"
+                ))
+                uids.append(email_data.get('uid'))
+            
+            if not email_objs:
+                return
             
-            # Mark email as read to prevent reprocessing
-            if 'uid' in email_data:
-                # Get the connection to mark as read
-                account_doc = await self.db.email_accounts.find_one({"id": email_data['account_id']})
-                if account_doc and account_doc['id'] in self.connections:
-                    connection = self.connections[account_doc['id']]
-                    connection.mark_email_as_read(email_data['uid'])
+            # Store in database; the unique (message_id, account_id) index rejects anything
+            # inserted concurrently since the duplicate check
+            skipped = set()
+            try:
+                await self.db.emails.insert_many([email_obj.dict() for email_obj in email_objs], ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    if error.get('code') != DUPLICATE_KEY_ERROR:
+                        logger.error(f"❌ Error storing email: {error.get('errmsg')}")
+                    skipped.add(error['index'])
             
-            # Process through AI workflow (async)
-            asyncio.create_task(self._process_email_ai_workflow(email_obj.id))
+            stored = [email_obj for index, email_obj in enumerate(email_objs) if index not in skipped]
+            processed_uids = [uid for index, uid in enumerate(uids) if index not in skipped and uid is not None]
             
-            logger.info(f"📥 New email processed: {email_data['subject']} from {email_data['sender']}")
+            # Embed the whole batch in one Cohere call so each workflow finds its embedding cached
+            if len(stored) > 1:
+                try:
+                    await self._lazy_server().get_cohere_embeddings([email_obj.body for email_obj in stored])
+                except Exception as e:
+                    logger.warning(f"⚠️ Batch embedding failed, emails will be embedded individually: {str(e)}")
+            
+            for email_obj in stored:
+                # Process through AI workflow (async)
+                asyncio.create_task(self._process_email_ai_workflow(email_obj.id))
+                
+                logger.info(f"📥 New email processed: {email_obj.subject} from {email_obj.sender}")
+            
+            # Mark the stored emails as read in one command; anything that failed stays unread
+            if processed_uids:
+                await asyncio.to_thread(connection.mark_emails_as_read, processed_uids)
             
         except Exception as e:
-            logger.error(f"❌ Error processing new email: {str(e)}")
+            logger.error(f"❌ Error processing new emails: {str(e)}")
     
     async def _process_email_ai_workflow(self, email_id: str):
         """Process email through AI workflow - delegate to server's process_email_async"""
         try:
-            # Import the function dynamically to avoid circular imports
-            import importlib
-            server_module = importlib.import_module('server')
-            process_func = getattr(server_module, 'process_email_async')
-            
             # Delegate to server's complete AI workflow
-            await process_func(email_id)
+            await self._lazy_server().process_email_async(email_id)
                 
         except Exception as e:
             logger.error(f"❌ Error in AI workflow for email {email_id}: {str(e)}")
@@ -547,70 +1193,13 @@ class EmailPollingService:
                 {"id": email_id},
                 {"$set": {"status": "error", "error": str(e)}}
             )
-    
-    async def _auto_send_email(self, email_id: str):
-        """Automatically send approved email"""
-        try:
-            # Get email
-            email_doc = await self.db.emails.find_one({"id": email_id})
-            if not email_doc or email_doc['status'] != 'ready_to_send':
-                return
-            
-            # Get account
-            account_doc = await self.db.email_accounts.find_one({"id": email_doc['account_id']})
-            if not account_doc or not account_doc.get('is_active') or not account_doc.get('auto_send', True):
-                return
-            
-            # Create connection
-            connection = EmailConnection(account_doc)
-            
-            # Extract sender email
-            sender_email = email_doc['sender']
-            if '<' in sender_email:
-                sender_email = sender_email.split('<')[1].split('>')[0]
-            
-            # Prepare reply subject
-            subject = email_doc['subject']
-            if not subject.lower().startswith('re:'):
-                subject = f"Re: {subject}"
-            
-            # Send email
-            success = connection.send_email(
-                to_email=sender_email,
-                subject=subject,
-                body=email_doc['draft'],
-                body_html=email_doc['draft_html'],
-                message_id_to_reply=email_doc['message_id'],
-                references=email_doc.get('references', '')
-            )
-            
-            if success:
-                # Update status to sent
-                await self.db.emails.update_one(
-                    {"id": email_id},
-                    {"$set": {
-                        "status": "sent",
-                        "sent_at": datetime.utcnow()
-                    }}
-                )
-                logger.info(f"✅ Auto-sent reply for email: {email_doc['subject']}")
-            else:
-                # Mark as failed to send
-                await self.db.emails.update_one(
-                    {"id": email_id},
-                    {"$set": {"status": "send_failed"}}
-                )
-                
-        except Exception as e:
-            logger.error(f"❌ Error auto-sending email {email_id}: {str(e)}")
-            await self.db.emails.update_one(
-                {"id": email_id},
-                {"$set": {"status": "send_failed", "error": str(e)}}
-            )
 
 # Global polling service instance
 polling_service = None
 
+# Shared pool of connections used for sending
+connection_pool = EmailConnectionPool()
+
 def get_polling_service(mongo_url: str, db_name: str) -> EmailPollingService:
     """Get or create the global polling service instance"""
     global polling_service
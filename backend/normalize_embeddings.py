@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+One-off migration: scale every stored intent and knowledge base embedding to unit length
+and store it as packed float32 bytes.
+
+The server now normalizes embeddings when it stores them, writes them as float32 bytes,
+marks those documents with embedding_normalized, and scores with a plain dot product.
+Unflagged documents are normalized in memory when the server loads them; run this once
+to fix them for good:
+
+    cd backend && python normalize_embeddings.py
+"""
+import asyncio
+import os
+from pathlib import Path
+
+import numpy as np
+from bson.binary import Binary
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+COLLECTIONS = ("intents", "knowledge_base")
+
+
+async def normalize_collection(collection) -> int:
+    """Normalize, pack and flag the embeddings in a collection not yet marked embedding_normalized"""
+    updates = []
+    query = {"embedding": {"$exists": True}, "embedding_normalized": {"$ne": True}}
+    async for doc in collection.find(query, {"_id": 1, "embedding": 1}):
+        if isinstance(doc["embedding"], bytes):
+            vector = np.frombuffer(doc["embedding"], dtype=np.float32)
+        else:
+            vector = np.asarray(doc["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm != 0:
+            vector = vector / norm
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+            "embedding": Binary(vector.astype(np.float32).tobytes()),
+            "embedding_normalized": True
+        }}))
+    
+    if updates:
+        await collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for name in COLLECTIONS:
+            count = await normalize_collection(db[name])
+            print(f"✅ {name}: normalized, packed and flagged {count} embeddings")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
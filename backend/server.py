@@ -1,17 +1,21 @@
 from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from bson.binary import Binary
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Union, Dict, Any
+from typing import List, Optional, Union, Dict, Any, Tuple
 import uuid
 from datetime import datetime, timedelta
 import json
 import asyncio
 import httpx
+import numpy as np
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import smtplib
@@ -20,17 +24,43 @@ import email
 import re
 from email.header import decode_header
 import time
+import hashlib
+from collections import OrderedDict
+
+# Optional SIMD kernels for similarity scoring; NumPy is used when not installed
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+# In-memory embedding matrices are half precision when SimSIMD's f16 kernels can score
+# them; NumPy has no fast float16 matmul, so it keeps float32
+EMBEDDING_MATRIX_DTYPE = np.float16 if simsimd is not None else np.float32
+
+# Optional approximate nearest-neighbour search for large intent/KB collections
+try:
+    import faiss
+except ImportError:
+    faiss = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Size the pool for the concurrent reads in process_email_async and fail fast when
+# the server is unreachable; zstd falls back to zlib if zstandard is not installed
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=100,
+    minPoolSize=10,
+    serverSelectionTimeoutMS=3000,
+    compressors='zstd,zlib'
+)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI(title="Automated Email Assistant API")
+app = FastAPI(title="Automated Email Assistant API", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -39,6 +69,16 @@ api_router = APIRouter(prefix="/api")
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 COHERE_API_KEY = os.environ.get('COHERE_API_KEY')
 
+# Request headers for the AI APIs, built once instead of on every call
+GROQ_HEADERS = {
+    "Authorization": f"Bearer {GROQ_API_KEY}",
+    "Content-Type": "application/json"
+}
+COHERE_HEADERS = {
+    "Authorization": f"Bearer {COHERE_API_KEY}",
+    "Content-Type": "application/json"
+}
+
 # Email provider configurations
 EMAIL_PROVIDERS = {
     "gmail": {
@@ -112,6 +152,7 @@ class EmailAccount(BaseModel):
     signature: str = ""
     last_uid: int = 0
     uidvalidity: Optional[str] = None
+    highestmodseq: Optional[int] = None
     last_polled: Optional[datetime] = None
     auto_send: bool = True  # Auto-send approved replies
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -192,71 +233,325 @@ class EmailMessage(BaseModel):
     error: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class EmailListItem(BaseModel):
+    """The EmailMessage fields the email list shows; GET /emails/{id} returns the full email"""
+    id: str
+    account_id: str
+    thread_id: str
+    subject: str
+    sender: str
+    body: str
+    received_at: datetime
+    status: str = "new"
+    intents: List[Dict[str, Any]] = []
+    draft: str = ""
+    validation_result: Optional[Dict[str, Any]] = None
+    processed_at: Optional[datetime] = None
+    sent_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class EmailStatus(BaseModel):
+    id: str
+    status: str
+    processed_at: Optional[datetime] = None
+    sent_at: Optional[datetime] = None
+    error: Optional[str] = None
+
 # Import email services and model
-from email_services import get_polling_service, EmailConnection
+from email_services import get_polling_service, connection_pool
 
 # Global polling service
 polling_service = None
 
+# Recently computed Cohere embeddings, keyed by a hash of the text: LRU bounded, with a TTL
+EMBEDDING_CACHE_SIZE = 1024
+EMBEDDING_CACHE_TTL = 60 * 60
+_embedding_cache: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+# Cohere's embed endpoint accepts at most this many texts per request
+COHERE_EMBED_BATCH_SIZE = 96
+COHERE_EMBED_MODEL = "embed-english-v3.0"
+# Embeddings are also persisted in the embedding_cache collection, expiring after this long
+EMBEDDING_STORE_TTL = 30 * 24 * 60 * 60
+
+# Shared HTTP client for the Cohere and Groq APIs, kept on app.state
+HTTP_CLIENT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP/2 client, creating it on first use (or after shutdown closed it)"""
+    http_client = getattr(app.state, "http", None)
+    if http_client is None or http_client.is_closed:
+        http_client = app.state.http = httpx.AsyncClient(http2=True, timeout=30, limits=HTTP_CLIENT_LIMITS)
+    return http_client
+
 # Helper Functions
 async def get_cohere_embedding(text: str) -> List[float]:
-    """Get embedding from Cohere API"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://api.cohere.com/v1/embed",
-            headers={
-                "Authorization": f"Bearer {COHERE_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "embed-english-v3.0",
-                "texts": [text],
-                "input_type": "classification",
-                "truncate": "NONE"
-            }
-        )
-        if response.status_code == 200:
-            result = response.json()
-            return result["embeddings"][0]
+    """Get embedding from Cohere API, reusing a cached one for text embedded recently"""
+    return (await get_cohere_embeddings([text]))[0]
+
+async def get_cohere_embeddings(texts: List[str]) -> List[List[float]]:
+    """Get embeddings for several texts, requesting everything not cached in as few API calls as possible"""
+    now = time.monotonic()
+    # The key covers the model too, so switching models never returns stale vectors
+    keys = [hashlib.blake2b(f"{COHERE_EMBED_MODEL}:{text}".encode(), digest_size=16).hexdigest() for text in texts]
+    embeddings = {}
+    missing = {}
+    for key, text in zip(keys, texts):
+        cached = _embedding_cache.get(key)
+        if cached and now - cached[0] < EMBEDDING_CACHE_TTL:
+            _embedding_cache.move_to_end(key)
+            embeddings[key] = cached[1]
         else:
-            raise HTTPException(status_code=500, detail=f"Cohere API error: {response.text}")
+            missing[key] = text
+    
+    # Then the persistent tier, which survives restarts and is shared between workers
+    if missing:
+        try:
+            async for doc in db.embedding_cache.find({"_id": {"$in": list(missing)}}, {"embedding": 1}):
+                embeddings[doc["_id"]] = doc["embedding"]
+                _embedding_cache[doc["_id"]] = (now, doc["embedding"])
+                del missing[doc["_id"]]
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding cache lookup failed: {str(e)}")
+    
+    missing_keys = list(missing)
+    for start in range(0, len(missing_keys), COHERE_EMBED_BATCH_SIZE):
+        batch = missing_keys[start:start + COHERE_EMBED_BATCH_SIZE]
+        batch_embeddings = await _request_cohere_embeddings([missing[key] for key in batch])
+        for key, embedding in zip(batch, batch_embeddings):
+            embeddings[key] = embedding
+            _embedding_cache[key] = (time.monotonic(), embedding)
+            _embedding_cache.move_to_end(key)
+        try:
+            await db.embedding_cache.bulk_write([
+                UpdateOne(
+                    {"_id": key},
+                    {"$set": {"embedding": embedding, "model": COHERE_EMBED_MODEL, "created_at": datetime.utcnow()}},
+                    upsert=True
+                )
+                for key, embedding in zip(batch, batch_embeddings)
+            ], ordered=False)
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding cache write failed: {str(e)}")
+    
+    while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+    return [embeddings[key] for key in keys]
+
+async def _request_cohere_embeddings(texts: List[str]) -> List[List[float]]:
+    """Call the Cohere embed API for up to COHERE_EMBED_BATCH_SIZE texts"""
+    response = await get_http_client().post(
+        "https://api.cohere.com/v1/embed",
+        headers=COHERE_HEADERS,
+        json={
+            "model": COHERE_EMBED_MODEL,
+            "texts": texts,
+            "input_type": "classification",
+            "truncate": "NONE"
+        }
+    )
+    if response.status_code == 200:
+        result = response.json()
+        return result["embeddings"]
+    else:
+        raise HTTPException(status_code=500, detail=f"Cohere API error: {response.text}")
 
 async def groq_chat_completion(messages: List[Dict], system_prompt: str = "") -> str:
-    """Get completion from Groq API"""
+    """Get completion from Groq API.
+    
+    The response is streamed and assembled here: the HTTP read timeout then applies between
+    chunks, so a long reasoning-model completion can't time out while still generating.
+    """
     if system_prompt:
         messages = [{"role": "system", "content": system_prompt}] + messages
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "messages": messages,
-                "model": "deepseek-r1-distill-llama-70b",
-                "temperature": 0.6,
-                "max_completion_tokens": 4096,
-                "top_p": 0.95,
-                "stream": False
-            }
-        )
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        else:
+    async with get_http_client().stream(
+        "POST",
+        "https://api.groq.com/openai/v1/chat/completions",
+        headers=GROQ_HEADERS,
+        json={
+            "messages": messages,
+            "model": "deepseek-r1-distill-llama-70b",
+            "temperature": 0.6,
+            "max_completion_tokens": 4096,
+            "top_p": 0.95,
+            "stream": True
+        }
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
             raise HTTPException(status_code=500, detail=f"Groq API error: {response.text}")
+        
+        # Server-sent events: one "data: {json}" line per chunk, ending with "data: [DONE]"
+        parts = []
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[len("data: "):]
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices")
+            if choices:
+                parts.append(choices[0].get("delta", {}).get("content") or "")
+        return "".join(parts)
+
+def cosine_similarity(a: Union[List[float], np.ndarray, bytes], b: Union[List[float], np.ndarray, bytes]) -> float:
+    """Calculate cosine similarity between two embeddings (lists, float32 arrays or stored float32 bytes)"""
+    a = embedding_to_array(a)
+    b = embedding_to_array(b)
+    magnitude_product = np.linalg.norm(a) * np.linalg.norm(b)
+    if magnitude_product == 0:
+        return 0.0
+    return float(a @ b / magnitude_product)
+
+def normalize_embedding(embedding: List[float]) -> Binary:
+    """Scale an embedding to unit length for storage.
+    
+    Stored embeddings are kept normalized, as packed float32 bytes: a quarter of the size
+    of a BSON array of doubles, and loaded with np.frombuffer instead of a per-element decode.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector /= np.linalg.norm(vector) + 1e-12
+    return Binary(vector.tobytes())
+
+def embedding_to_array(embedding: Union[List[float], np.ndarray, bytes]) -> np.ndarray:
+    """Read an embedding as a float32 vector, whether stored as float32 bytes or (legacy) a list"""
+    if isinstance(embedding, bytes):
+        return np.frombuffer(embedding, dtype=np.float32)
+    return np.ascontiguousarray(embedding, dtype=np.float32)
+
+def build_embedding_matrix(docs: List[Dict[str, Any]]) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """Stack the stored (unit-length) embeddings of docs into an EMBEDDING_MATRIX_DTYPE matrix.
+    
+    Returns (matrix, docs) where row i of the matrix belongs to docs[i]; docs without
+    an embedding are left out. The inner product of a row with a unit query is its cosine.
+    Rows of docs written before embeddings were normalized (no embedding_normalized flag)
+    are normalized here, so mixed data scores correctly until normalize_embeddings.py runs.
+    """
+    docs = [doc for doc in docs if doc.get("embedding")]
+    if not docs:
+        return np.empty((0, 0), dtype=EMBEDDING_MATRIX_DTYPE), []
+    matrix = np.stack([embedding_to_array(doc["embedding"]) for doc in docs])
+    legacy = np.array([not doc.get("embedding_normalized") for doc in docs])
+    if legacy.any():
+        matrix[legacy] /= np.linalg.norm(matrix[legacy], axis=1, keepdims=True) + 1e-12
+    return matrix.astype(EMBEDDING_MATRIX_DTYPE, copy=False), docs
+
+def similarity_scores(matrix: np.ndarray, query: Union[List[float], np.ndarray]) -> np.ndarray:
+    """Cosine similarity of a query against every row of a build_embedding_matrix matrix"""
+    query = np.asarray(query, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm == 0 or not len(matrix):
+        return np.zeros(len(matrix), dtype=np.float32)
+    if simsimd is not None:
+        distances = simsimd.cdist(query[np.newaxis, :].astype(matrix.dtype), matrix, metric="cosine")
+        return 1 - np.asarray(distances, dtype=np.float32).ravel()
+    return matrix @ (query / norm)
+
+def build_ann_index(matrix: np.ndarray):
+    """Build an HNSW inner-product index over a matrix large enough to benefit from one, else None"""
+    if faiss is None or len(matrix) < ANN_MIN_ITEMS:
+        return None
+    index = faiss.IndexHNSWFlat(matrix.shape[1], ANN_HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+    index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+    return index
+
+def similarity_search(matrix: np.ndarray, ann_index, query: Union[List[float], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (row indices, cosine scores) of the rows to consider for a query.
+    
+    Without an ANN index that is every row, scored exactly; with one it is the nearest
+    ANN_CANDIDATES rows found by the index.
+    """
+    if ann_index is None:
+        return np.arange(len(matrix)), similarity_scores(matrix, query)
+    query = np.asarray(query, dtype=np.float32)
+    query = query / (np.linalg.norm(query) + 1e-12)
+    scores, indices = ann_index.search(query[np.newaxis, :], min(ANN_CANDIDATES, len(matrix)))
+    found = indices[0] >= 0
+    return indices[0][found], scores[0][found]
+
+# In-process embedding indexes for the intents and knowledge_base collections. Writes through
+# this API bump the collection's version; the max age picks up changes made elsewhere
+EMBEDDING_INDEX_MAX_AGE = 5 * 60
+_embedding_index_versions = {"intents": 0, "knowledge_base": 0}
+_embedding_indexes: Dict[str, Tuple[int, float, np.ndarray, List[Dict[str, Any]], Any, np.ndarray]] = {}
+# One rebuild at a time per collection; the latest background rebuild scheduled by a write
+_embedding_index_locks = {"intents": asyncio.Lock(), "knowledge_base": asyncio.Lock()}
+_embedding_index_refreshes: Dict[str, asyncio.Task] = {}
+
+# Collections this large get a FAISS HNSW index (when faiss is installed), searched for
+# the nearest ANN_CANDIDATES rows instead of scoring every row
+ANN_MIN_ITEMS = 5000
+ANN_HNSW_NEIGHBORS = 32
+ANN_CANDIDATES = 50
+
+# Fields classification and KB retrieval read, besides the embedding itself
+EMBEDDING_INDEX_PROJECTIONS = {
+    "intents": {"_id": 0, "id": 1, "name": 1, "description": 1, "system_prompt": 1,
+                "confidence_threshold": 1, "is_meeting_related": 1, "embedding": 1, "embedding_normalized": 1},
+    "knowledge_base": {"_id": 0, "id": 1, "title": 1, "content": 1, "tags": 1, "embedding": 1,
+                       "embedding_normalized": 1},
+}
+
+# Minimum similarity for a row to match: (per-document field, default when it is missing)
+EMBEDDING_INDEX_THRESHOLDS = {
+    "intents": ("confidence_threshold", 0.7),
+    "knowledge_base": (None, 0.5),  # Lower threshold for better coverage
+}
 
-def cosine_similarity(a: List[float], b: List[float]) -> float:
-    """Calculate cosine similarity between two embeddings"""
-    import math
-    dot_product = sum(x * y for x, y in zip(a, b))
-    magnitude_a = math.sqrt(sum(x * x for x in a))
-    magnitude_b = math.sqrt(sum(x * x for x in b))
-    if magnitude_a == 0 or magnitude_b == 0:
-        return 0
-    return dot_product / (magnitude_a * magnitude_b)
+def invalidate_embedding_index(collection_name: str):
+    """Mark a collection's cached embedding index stale after a write and rebuild it in the background"""
+    _embedding_index_versions[collection_name] += 1
+    refresh = asyncio.create_task(get_embedding_index(collection_name))
+    refresh.add_done_callback(_log_embedding_index_refresh)
+    _embedding_index_refreshes[collection_name] = refresh
+
+def _log_embedding_index_refresh(refresh: asyncio.Task):
+    if not refresh.cancelled() and refresh.exception():
+        logger.warning(f"⚠️ Embedding index rebuild failed: {str(refresh.exception())}")
+
+def _cached_embedding_index(collection_name: str):
+    """The cached (matrix, docs, ann_index, thresholds) for a collection if still current, else None"""
+    cached = _embedding_indexes.get(collection_name)
+    if (cached and cached[0] == _embedding_index_versions[collection_name]
+            and time.monotonic() - cached[1] < EMBEDDING_INDEX_MAX_AGE):
+        return cached[2:]
+    return None
+
+async def get_embedding_index(collection_name: str) -> Tuple[np.ndarray, List[Dict[str, Any]], Any, np.ndarray]:
+    """Return (matrix, docs, ann_index, thresholds) for a collection's embeddings, rebuilding the cached copy when stale.
+    
+    The returned docs have their embedding field dropped; row i of the matrix holds it and
+    thresholds[i] is the minimum score for it to match. ann_index is None unless the
+    collection is large enough for build_ann_index.
+    """
+    cached = _cached_embedding_index(collection_name)
+    if cached:
+        return cached
+    
+    async with _embedding_index_locks[collection_name]:
+        # Another caller may have rebuilt it while this one waited for the lock
+        cached = _cached_embedding_index(collection_name)
+        if cached:
+            return cached
+        
+        version = _embedding_index_versions[collection_name]
+        docs = await db[collection_name].find(
+            {"embedding": {"$exists": True}}, EMBEDDING_INDEX_PROJECTIONS[collection_name]
+        ).to_list(None)
+        matrix, docs = build_embedding_matrix(docs)
+        for doc in docs:
+            del doc["embedding"]
+            doc.pop("embedding_normalized", None)
+        # An HNSW build over a large collection takes long enough to stall every request
+        ann_index = await asyncio.to_thread(build_ann_index, matrix)
+        threshold_field, default_threshold = EMBEDDING_INDEX_THRESHOLDS[collection_name]
+        thresholds = np.array(
+            [doc.get(threshold_field, default_threshold) if threshold_field else default_threshold for doc in docs],
+            dtype=np.float32
+        )
+        # The whole tuple is swapped in at once, so readers never see a half-built index
+        _embedding_indexes[collection_name] = (version, time.monotonic(), matrix, docs, ann_index, thresholds)
+        return matrix, docs, ann_index, thresholds
 
 # Intent Management Routes
 @api_router.post("/intents", response_model=Intent)
@@ -266,22 +561,24 @@ async def create_intent(intent: IntentCreate):
     
     # Create embedding for intent description + examples
     text_for_embedding = f"{intent_obj.description} {' '.join(intent_obj.examples)}"
-    embedding = await get_cohere_embedding(text_for_embedding)
+    embedding = normalize_embedding(await get_cohere_embedding(text_for_embedding))
     
     # Store with embedding
     doc = intent_obj.dict()
     doc["embedding"] = embedding
+    doc["embedding_normalized"] = True
     await db.intents.insert_one(doc)
+    invalidate_embedding_index("intents")
     return intent_obj
 
 @api_router.get("/intents", response_model=List[Intent])
 async def get_intents():
-    intents = await db.intents.find().to_list(1000)
+    intents = await db.intents.find({}, {"embedding": 0}).to_list(1000)
     return [Intent(**intent) for intent in intents]
 
 @api_router.get("/intents/{intent_id}", response_model=Intent)
 async def get_intent(intent_id: str):
-    intent_doc = await db.intents.find_one({"id": intent_id})
+    intent_doc = await db.intents.find_one({"id": intent_id}, {"embedding": 0})
     if not intent_doc:
         raise HTTPException(status_code=404, detail="Intent not found")
     return Intent(**intent_doc)
@@ -289,7 +586,7 @@ async def get_intent(intent_id: str):
 @api_router.put("/intents/{intent_id}", response_model=Intent)
 async def update_intent(intent_id: str, intent: IntentCreate):
     # Check if intent exists
-    existing_intent = await db.intents.find_one({"id": intent_id})
+    existing_intent = await db.intents.find_one({"id": intent_id}, {"embedding": 0})
     if not existing_intent:
         raise HTTPException(status_code=404, detail="Intent not found")
     
@@ -302,16 +599,18 @@ async def update_intent(intent_id: str, intent: IntentCreate):
     new_text = f"{intent.description} {' '.join(intent.examples)}"
     
     if old_text != new_text:
-        update_data["embedding"] = await get_cohere_embedding(new_text)
+        update_data["embedding"] = normalize_embedding(await get_cohere_embedding(new_text))
+        update_data["embedding_normalized"] = True
     
     # Update in database
     await db.intents.update_one(
         {"id": intent_id},
         {"$set": update_data}
     )
+    invalidate_embedding_index("intents")
     
     # Return updated intent
-    updated_intent = await db.intents.find_one({"id": intent_id})
+    updated_intent = await db.intents.find_one({"id": intent_id}, {"embedding": 0})
     return Intent(**updated_intent)
 
 @api_router.delete("/intents/{intent_id}")
@@ -319,6 +618,7 @@ async def delete_intent(intent_id: str):
     result = await db.intents.delete_one({"id": intent_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Intent not found")
+    invalidate_embedding_index("intents")
     return {"message": "Intent deleted successfully"}
 
 # Email Account Management Routes
@@ -340,15 +640,23 @@ async def create_email_account(account: EmailAccountCreate):
     
     account_obj = EmailAccount(**account_dict)
     await db.email_accounts.insert_one(account_obj.dict())
+    
+    # Poll the new account now rather than after the current back-off
+    if polling_service:
+        polling_service.accounts_changed()
     return account_obj
 
 @api_router.get("/email-accounts", response_model=List[EmailAccount])
 async def get_email_accounts():
-    accounts = await db.email_accounts.find().to_list(1000)
+    # Read only the EmailAccount fields, filling in model defaults for fields that older
+    # documents lack, and serialize the result directly
+    projection = {field: 1 for field in EmailAccount.model_fields}
+    projection["_id"] = 0
+    accounts = await db.email_accounts.find({}, projection).to_list(1000)
     # Don't return passwords in response
     for account in accounts:
         account["password"] = "***"
-    return [EmailAccount(**account) for account in accounts]
+    return ORJSONResponse([EmailAccount(**account).model_dump() for account in accounts])
 
 @api_router.get("/email-accounts/{account_id}", response_model=EmailAccount)
 async def get_email_account(account_id: str):
@@ -384,6 +692,8 @@ async def update_email_account(account_id: str, account: EmailAccountCreate):
     
     if connection_changed:
         global polling_service
+        if polling_service:
+            polling_service.stop_idle(account_id)
         if polling_service and account_id in polling_service.connections:
             try:
                 polling_service.connections[account_id].disconnect_imap()
@@ -407,6 +717,9 @@ async def update_email_account(account_id: str, account: EmailAccountCreate):
 async def delete_email_account(account_id: str):
     # Remove connection if exists
     global polling_service
+    connection_pool.invalidate(account_id)
+    if polling_service:
+        polling_service.stop_idle(account_id)
     if polling_service and account_id in polling_service.connections:
         try:
             polling_service.connections[account_id].disconnect_imap()
@@ -433,9 +746,14 @@ async def toggle_email_account(account_id: str):
         {"$set": {"is_active": new_status}}
     )
     
+    global polling_service
+    if new_status and polling_service:
+        polling_service.accounts_changed()
+    
     # If deactivating, remove connection
     if not new_status:
-        global polling_service
+        if polling_service:
+            polling_service.stop_idle(account_id)
         if polling_service and account_id in polling_service.connections:
             try:
                 polling_service.connections[account_id].disconnect_imap()
@@ -465,12 +783,14 @@ async def control_account_polling(account_id: str, request: PollingControlReques
         )
         
         # Force create new connection on next poll
+        polling_service.stop_idle(account_id)
         if account_id in polling_service.connections:
             try:
                 polling_service.connections[account_id].disconnect_imap()
                 del polling_service.connections[account_id]
             except Exception as e:
                 logger.warning(f"⚠️  Error removing old connection: {str(e)}")
+        polling_service.accounts_changed()
         
         return {"message": f"Polling started for account: {account['email']}"}
     
@@ -482,6 +802,7 @@ async def control_account_polling(account_id: str, request: PollingControlReques
         )
         
         # Remove connection
+        polling_service.stop_idle(account_id)
         if account_id in polling_service.connections:
             try:
                 polling_service.connections[account_id].disconnect_imap()
@@ -516,22 +837,43 @@ async def create_knowledge_base(kb: KnowledgeBaseCreate):
     kb_obj = KnowledgeBase(**kb_dict)
     
     # Create embedding for content
-    embedding = await get_cohere_embedding(kb_obj.content)
+    embedding = normalize_embedding(await get_cohere_embedding(kb_obj.content))
     
     # Store with embedding
     doc = kb_obj.dict()
     doc["embedding"] = embedding
+    doc["embedding_normalized"] = True
     await db.knowledge_base.insert_one(doc)
+    invalidate_embedding_index("knowledge_base")
     return kb_obj
 
+@api_router.post("/knowledge-base/bulk", response_model=List[KnowledgeBase])
+async def create_knowledge_base_bulk(kbs: List[KnowledgeBaseCreate]):
+    """Create many knowledge base items, embedding their content in batched Cohere calls"""
+    kb_objs = [KnowledgeBase(**kb.dict()) for kb in kbs]
+    if not kb_objs:
+        return []
+    
+    embeddings = await get_cohere_embeddings([kb_obj.content for kb_obj in kb_objs])
+    
+    docs = []
+    for kb_obj, embedding in zip(kb_objs, embeddings):
+        doc = kb_obj.dict()
+        doc["embedding"] = normalize_embedding(embedding)
+        doc["embedding_normalized"] = True
+        docs.append(doc)
+    await db.knowledge_base.insert_many(docs)
+    invalidate_embedding_index("knowledge_base")
+    return kb_objs
+
 @api_router.get("/knowledge-base", response_model=List[KnowledgeBase])
 async def get_knowledge_base():
-    kb_items = await db.knowledge_base.find().to_list(1000)
+    kb_items = await db.knowledge_base.find({}, {"embedding": 0}).to_list(1000)
     return [KnowledgeBase(**kb) for kb in kb_items]
 
 @api_router.get("/knowledge-base/{kb_id}", response_model=KnowledgeBase)
 async def get_knowledge_base_item(kb_id: str):
-    kb_doc = await db.knowledge_base.find_one({"id": kb_id})
+    kb_doc = await db.knowledge_base.find_one({"id": kb_id}, {"embedding": 0})
     if not kb_doc:
         raise HTTPException(status_code=404, detail="Knowledge base item not found")
     return KnowledgeBase(**kb_doc)
@@ -539,7 +881,7 @@ async def get_knowledge_base_item(kb_id: str):
 @api_router.put("/knowledge-base/{kb_id}", response_model=KnowledgeBase)
 async def update_knowledge_base(kb_id: str, kb: KnowledgeBaseCreate):
     # Check if KB item exists
-    existing_kb = await db.knowledge_base.find_one({"id": kb_id})
+    existing_kb = await db.knowledge_base.find_one({"id": kb_id}, {"embedding": 0})
     if not existing_kb:
         raise HTTPException(status_code=404, detail="Knowledge base item not found")
     
@@ -549,16 +891,18 @@ async def update_knowledge_base(kb_id: str, kb: KnowledgeBaseCreate):
     
     # Regenerate embedding if content changed
     if existing_kb.get('content', '') != kb.content:
-        update_data["embedding"] = await get_cohere_embedding(kb.content)
+        update_data["embedding"] = normalize_embedding(await get_cohere_embedding(kb.content))
+        update_data["embedding_normalized"] = True
     
     # Update in database
     await db.knowledge_base.update_one(
         {"id": kb_id},
         {"$set": update_data}
     )
+    invalidate_embedding_index("knowledge_base")
     
     # Return updated KB item
-    updated_kb = await db.knowledge_base.find_one({"id": kb_id})
+    updated_kb = await db.knowledge_base.find_one({"id": kb_id}, {"embedding": 0})
     return KnowledgeBase(**updated_kb)
 
 @api_router.delete("/knowledge-base/{kb_id}")
@@ -566,12 +910,13 @@ async def delete_knowledge_base(kb_id: str):
     result = await db.knowledge_base.delete_one({"id": kb_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Knowledge base item not found")
+    invalidate_embedding_index("knowledge_base")
     return {"message": "Knowledge base item deleted successfully"}
 
 # Email Processing Routes
-@api_router.post("/emails/test")
-async def test_email_processing(request: EmailTestRequest):
-    """Test email processing with manual input"""
+@api_router.post("/emails/test", status_code=202)
+async def test_email_processing(request: EmailTestRequest, background_tasks: BackgroundTasks):
+    """Test email processing with manual input; clients poll GET /emails/{id} for the result"""
     # Create a test email message
     email_obj = EmailMessage(
         account_id=request.account_id,
@@ -586,14 +931,20 @@ async def test_email_processing(request: EmailTestRequest):
     )
     
     # Store in database
-    await db.emails.insert_one(email_obj.dict())
-    
-    # Process the email
-    await process_email_async(email_obj.id)
-    
-    # Return processed email
-    processed_email = await db.emails.find_one({"id": email_obj.id})
-    return EmailMessage(**processed_email)
+    email_doc = email_obj.dict()
+    await db.emails.insert_one(email_doc)
+    email_doc.pop("_id", None)
+    
+    # Process the email after the response has been sent
+    background_tasks.add_task(process_email_async, email_obj.id)
+    
+    # Receipt: the stored email, still in "processing"
+    return ORJSONResponse(
+        email_doc,
+        status_code=202,
+        headers={"Retry-After": "2"},
+        background=background_tasks
+    )
 
 @api_router.post("/emails/{email_id}/send")
 async def send_email_reply(email_id: str, request: SendEmailRequest):
@@ -610,9 +961,6 @@ async def send_email_reply(email_id: str, request: SendEmailRequest):
     if not account_doc:
         raise HTTPException(status_code=404, detail="Email account not found")
     
-    # Create connection and send
-    connection = EmailConnection(account_doc)
-    
     # Extract sender email
     sender_email = email_doc['sender']
     if '<' in sender_email:
@@ -623,15 +971,17 @@ async def send_email_reply(email_id: str, request: SendEmailRequest):
     if not subject.lower().startswith('re:'):
         subject = f"Re: {subject}"
     
-    # Send email
-    success = connection.send_email(
-        to_email=sender_email,
-        subject=subject,
-        body=email_doc['draft'],
-        body_html=email_doc['draft_html'],
-        message_id_to_reply=email_doc['message_id'],
-        references=email_doc.get('references', '')
-    )
+    # Send email on a pooled connection (smtplib blocks, so run it off the event loop)
+    async with connection_pool.acquire(account_doc) as connection:
+        success = await asyncio.to_thread(
+            connection.send_email,
+            to_email=sender_email,
+            subject=subject,
+            body=email_doc['draft'],
+            body_html=email_doc['draft_html'],
+            message_id_to_reply=email_doc['message_id'],
+            references=email_doc.get('references', '')
+        )
     
     if success:
         # Update status to sent
@@ -651,6 +1001,34 @@ async def send_email_reply(email_id: str, request: SendEmailRequest):
         )
         raise HTTPException(status_code=500, detail="Failed to send email")
 
+def start_polling_task(service) -> asyncio.Task:
+    """Run a polling service's loop as a task kept on app.state, so it can't be garbage collected.
+    
+    If the loop dies with an exception it is logged and the service marked stopped, so the
+    status endpoints stop reporting it as running.
+    """
+    def on_exit(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error("❌ Email polling crashed", exc_info=task.exception())
+            service.is_running = False
+    
+    task = asyncio.create_task(service.start_polling())
+    task.add_done_callback(on_exit)
+    app.state.polling_task = task
+    return task
+
+async def stop_polling_task(service):
+    """Stop a polling service and wait for its loop task to finish, so a restart can't overlap it"""
+    service.stop_polling()
+    task = getattr(app.state, "polling_task", None)
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    app.state.polling_task = None
+
 # Email Polling Control Routes
 @api_router.post("/polling/control")
 async def control_email_polling(request: PollingControlRequest):
@@ -658,17 +1036,18 @@ async def control_email_polling(request: PollingControlRequest):
     global polling_service
     
     if request.action == "start":
-        if polling_service and polling_service.is_running:
+        polling_task = getattr(app.state, "polling_task", None)
+        if polling_task is not None and not polling_task.done():
             return {"message": "Email polling is already running"}
         
         polling_service = get_polling_service(mongo_url, os.environ['DB_NAME'])
         # Start polling in background
-        asyncio.create_task(polling_service.start_polling())
+        start_polling_task(polling_service)
         return {"message": "Email polling started"}
     
     elif request.action == "stop":
         if polling_service:
-            polling_service.stop_polling()
+            await stop_polling_task(polling_service)
             return {"message": "Email polling stopped"}
         return {"message": "Email polling was not running"}
     
@@ -769,7 +1148,7 @@ def is_bounce_or_delivery_error(email_message: EmailMessage) -> bool:
     
     return False
 
-async def classify_email_intents(email_message: EmailMessage) -> List[Dict[str, Any]]:
+async def classify_email_intents(email_message: EmailMessage, email_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
     """Classify email intents using Cohere embeddings, skip delivery errors"""
     
     # Skip delivery error/bounce emails
@@ -777,32 +1156,55 @@ async def classify_email_intents(email_message: EmailMessage) -> List[Dict[str,
         logger.info(f"🚫 Skipping delivery error/bounce email: {email_message.subject}")
         return []
     
-    # Get email embedding
-    email_embedding = await get_cohere_embedding(email_message.body)
+    # Get all intents with embeddings, alongside the email embedding unless the caller has it
+    if email_embedding is None:
+        email_embedding, (intent_matrix, intents, intent_ann, intent_thresholds) = await asyncio.gather(
+            get_cohere_embedding(email_message.body),
+            get_embedding_index("intents")
+        )
+    else:
+        intent_matrix, intents, intent_ann, intent_thresholds = await get_embedding_index("intents")
+    
+    # Score them in one matrix-vector product (or an ANN search for large collections)
+    rows, scores = similarity_search(intent_matrix, intent_ann, email_embedding)
     
-    # Get all intents with embeddings
-    intents = await db.intents.find().to_list(1000)
+    # Return top 3 intents above their thresholds
+    matches = np.flatnonzero(scores >= intent_thresholds[rows])
+    top = matches[np.argsort(-scores[matches])][:3]
     
     intent_scores = []
-    for intent in intents:
-        if "embedding" in intent:
-            similarity = cosine_similarity(email_embedding, intent["embedding"])
-            if similarity >= intent.get("confidence_threshold", 0.7):
-                intent_scores.append({
-                    "intent_id": intent["id"],
-                    "name": intent["name"],
-                    "description": intent["description"],
-                    "system_prompt": intent.get("system_prompt", ""),
-                    "confidence": similarity,
-                    "is_meeting_related": intent.get("is_meeting_related", False)
-                })
+    for i in top:
+        intent = intents[rows[i]]
+        intent_scores.append({
+            "intent_id": intent["id"],
+            "name": intent["name"],
+            "description": intent["description"],
+            "system_prompt": intent.get("system_prompt", ""),
+            "confidence": float(scores[i]),
+            "is_meeting_related": intent.get("is_meeting_related", False)
+        })
     
-    # Return top 3 intents
-    intent_scores.sort(key=lambda x: x["confidence"], reverse=True)
-    return intent_scores[:3]
+    return intent_scores
+
+# Draft response cleanup: reasoning blocks, stray section labels, separator lines, and URLs to link
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+_DRAFT_LABEL_RE = re.compile(r'PLAIN_TEXT:|HTML:|Subject:|Re:.*?\n')
+_SEPARATOR_RE = re.compile(r'^-+|^=+', re.MULTILINE)
+_URL_RE = re.compile(r'(https?://[^\s<>"{}|\\^`[\]]+)')
 
-async def generate_draft(email_message: EmailMessage, intents: List[Dict[str, Any]]) -> Dict[str, str]:
-    """Generate email draft using Agent A (Groq API) with enhanced KB usage and link insertion"""
+async def _prefetched(value, fetch):
+    """Return a value the caller already fetched, or await fetch() for it"""
+    return value if value is not None else await fetch()
+
+async def generate_draft(email_message: EmailMessage, intents: List[Dict[str, Any]],
+                         email_embedding: Optional[List[float]] = None,
+                         kb_data: Optional[Dict[str, Any]] = None,
+                         account: Optional[Dict[str, Any]] = None,
+                         thread_history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, str]:
+    """Generate email draft using Agent A (Groq API) with enhanced KB usage and link insertion.
+    
+    kb_data, account and thread_history may be passed in by a caller that already fetched them.
+    """
     
     # Skip generating draft for delivery errors
     if is_bounce_or_delivery_error(email_message):
@@ -813,17 +1215,16 @@ async def generate_draft(email_message: EmailMessage, intents: List[Dict[str, An
             "reasoning": "Skipped - delivery error/bounce email detected"
         }
     
-    # Get account info
-    account = await db.email_accounts.find_one({"id": email_message.account_id})
+    # Get account info, enhanced knowledge base context with links, and thread history
+    # (to avoid duplicates) concurrently, unless the caller already has them
+    account, kb_data, thread_history = await asyncio.gather(
+        _prefetched(account, lambda: db.email_accounts.find_one({"id": email_message.account_id})),
+        _prefetched(kb_data, lambda: get_enhanced_knowledge_context(email_message.body, intents, email_embedding)),
+        _prefetched(thread_history, lambda: get_thread_history(email_message))
+    )
     if not account:
         raise HTTPException(status_code=404, detail="Email account not found")
     
-    # Get enhanced knowledge base context with links
-    kb_data = await get_enhanced_knowledge_context(email_message.body, intents)
-    
-    # Get thread history to avoid duplicates
-    thread_history = await get_thread_history(email_message)
-    
     # Build context
     intent_descriptions = []
     system_prompts = []
@@ -896,10 +1297,10 @@ Generate the email body content now, ensuring you use the knowledge base informa
     clean_response = response.strip()
     
     # Remove any <think> tags or reasoning content
-    import re
-    clean_response = re.sub(r'<think>.*?</think>', '', clean_response, flags=re.DOTALL)
-    clean_response = re.sub(r'PLAIN_TEXT:|HTML:|Subject:|Re:.*?\n', '', clean_response)
-    clean_response = re.sub(r'^-+|^=+', '', clean_response, flags=re.MULTILINE)  # Remove separator lines
+    if '<think>' in clean_response:
+        clean_response = _THINK_RE.sub('', clean_response)
+    clean_response = _DRAFT_LABEL_RE.sub('', clean_response)
+    clean_response = _SEPARATOR_RE.sub('', clean_response)  # Remove separator lines
     clean_response = clean_response.strip()
     
     # Generate enhanced HTML version from plain text with proper link formatting
@@ -908,8 +1309,7 @@ Generate the email body content now, ensuring you use the knowledge base informa
         html_version = f"<p>{html_version}</p>"
     
     # Make links clickable in HTML
-    url_pattern = r'(https?://[^\s<>"{}|\\^`[\]]+)'
-    html_version = re.sub(url_pattern, r'<a href="\1" target="_blank">\1</a>', html_version)
+    html_version = _URL_RE.sub(r'<a href="\1" target="_blank">\1</a>', html_version)
     
     return {
         "plain_text": clean_response,
@@ -917,7 +1317,10 @@ Generate the email body content now, ensuring you use the knowledge base informa
         "reasoning": f"Used KB items: {kb_data.get('items_count', 0)}, Links included: {len(all_links)}, Intents: {', '.join([i['name'] for i in intents])}"
     }
 
-async def validate_draft(email_message: EmailMessage, draft: Dict[str, str], intents: List[Dict[str, Any]]) -> Dict[str, Any]:
+async def validate_draft(email_message: EmailMessage, draft: Dict[str, str], intents: List[Dict[str, Any]],
+                         email_embedding: Optional[List[float]] = None,
+                         kb_data: Optional[Dict[str, Any]] = None,
+                         thread_history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
     """Enhanced draft validation using Agent B - checks KB usage, links, and thread context"""
     
     # Skip validation for delivery errors
@@ -929,8 +1332,10 @@ async def validate_draft(email_message: EmailMessage, draft: Dict[str, str], int
         }
     
     # Get enhanced KB context and links for validation
-    kb_data = await get_enhanced_knowledge_context(email_message.body, intents)
-    thread_history = await get_thread_history(email_message)
+    kb_data, thread_history = await asyncio.gather(
+        _prefetched(kb_data, lambda: get_enhanced_knowledge_context(email_message.body, intents, email_embedding)),
+        _prefetched(thread_history, lambda: get_thread_history(email_message))
+    )
     
     intent_descriptions = [f"- {intent['name']}: {intent['description']}" for intent in intents]
     
@@ -1011,8 +1416,7 @@ Validate the draft now:"""
     validation_response = validation_response.strip()
     
     # Remove any thinking tags if present
-    import re
-    validation_response = re.sub(r'<think>.*?</think>', '', validation_response, flags=re.DOTALL).strip()
+    validation_response = _THINK_RE.sub('', validation_response).strip()
     
     # Determine if it's a pass or fail - check the entire response
     is_pass = "PASS:" in validation_response.upper() or validation_response.upper().startswith("PASS")
@@ -1049,40 +1453,34 @@ Validate the draft now:"""
         "avoids_duplicates": avoids_duplicates
     }
 
+_LINK_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
 async def extract_links_from_knowledge_and_prompts(intents: List[Dict[str, Any]], kb_context: str) -> List[str]:
     """Extract URLs/links from knowledge base content and intent system prompts"""
-    import re
-    
     links = []
     
     # Extract links from knowledge base context
-    url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    kb_links = re.findall(url_pattern, kb_context)
+    kb_links = _LINK_RE.findall(kb_context)
     links.extend(kb_links)
     
     # Extract links from intent system prompts
     for intent in intents:
         system_prompt = intent.get('system_prompt', '')
-        prompt_links = re.findall(url_pattern, system_prompt)
+        prompt_links = _LINK_RE.findall(system_prompt)
         links.extend(prompt_links)
     
     # Remove duplicates while preserving order
-    unique_links = []
-    for link in links:
-        if link not in unique_links:
-            unique_links.append(link)
-    
-    return unique_links
+    return list(dict.fromkeys(links))
 
 async def get_thread_history(email_message: EmailMessage) -> List[Dict[str, Any]]:
     """Get previous emails in the same thread to avoid duplicate responses"""
     
-    # Find emails in the same thread
+    # Find emails in the same thread, reading only the fields the history needs
     thread_emails = await db.emails.find({
         "thread_id": email_message.thread_id,
         "status": {"$in": ["sent", "ready_to_send"]},
         "id": {"$ne": email_message.id}  # Exclude current email
-    }).sort("received_at", -1).limit(5).to_list(5)
+    }, {"_id": 0, "subject": 1, "draft": 1, "intents.name": 1, "sent_at": 1}).sort("received_at", -1).limit(5).to_list(5)
     
     history = []
     for email in thread_emails:
@@ -1095,25 +1493,30 @@ async def get_thread_history(email_message: EmailMessage) -> List[Dict[str, Any]
     
     return history
 
-async def get_enhanced_knowledge_context(email_body: str, intents: List[Dict[str, Any]]) -> Dict[str, Any]:
+async def get_enhanced_knowledge_context(email_body: str, intents: List[Dict[str, Any]],
+                                         email_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
     """Enhanced knowledge base context with better retrieval and link extraction"""
-    # Get email embedding
-    email_embedding = await get_cohere_embedding(email_body)
+    # Get all knowledge base items with embeddings, alongside the email embedding unless the caller has it
+    if email_embedding is None:
+        email_embedding, (kb_matrix, kb_items, kb_ann, kb_thresholds) = await asyncio.gather(
+            get_cohere_embedding(email_body),
+            get_embedding_index("knowledge_base")
+        )
+    else:
+        kb_matrix, kb_items, kb_ann, kb_thresholds = await get_embedding_index("knowledge_base")
     
-    # Get all knowledge base items with embeddings
-    kb_items = await db.knowledge_base.find({"embedding": {"$exists": True}}).to_list(1000)
+    # Score them in one matrix-vector product (or an ANN search for large collections)
+    rows, scores = similarity_search(kb_matrix, kb_ann, email_embedding)
     
     relevant_items = []
-    for item in kb_items:
-        if "embedding" in item:
-            similarity = cosine_similarity(email_embedding, item["embedding"])
-            if similarity >= 0.5:  # Lower threshold for better coverage
-                relevant_items.append({
-                    "title": item["title"],
-                    "content": item["content"],
-                    "tags": item.get("tags", []),
-                    "similarity": similarity
-                })
+    for i in np.flatnonzero(scores >= kb_thresholds[rows]):
+        item = kb_items[rows[i]]
+        relevant_items.append({
+            "title": item["title"],
+            "content": item["content"],
+            "tags": item.get("tags", []),
+            "similarity": float(scores[i])
+        })
     
     # Also include items that match intent keywords
     intent_keywords = []
@@ -1178,9 +1581,6 @@ async def auto_send_email(email_id: str):
         if not account_doc or not account_doc.get('is_active') or not account_doc.get('auto_send', True):
             return
         
-        # Create connection
-        connection = EmailConnection(account_doc)
-        
         # Extract sender email
         sender_email = email_doc['sender']
         if '<' in sender_email:
@@ -1191,15 +1591,17 @@ async def auto_send_email(email_id: str):
         if not subject.lower().startswith('re:'):
             subject = f"Re: {subject}"
         
-        # Send email
-        success = connection.send_email(
-            to_email=sender_email,
-            subject=subject,
-            body=email_doc['draft'],
-            body_html=email_doc['draft_html'],
-            message_id_to_reply=email_doc['message_id'],
-            references=email_doc.get('references', '')
-        )
+        # Send email on a pooled connection (smtplib blocks, so run it off the event loop)
+        async with connection_pool.acquire(account_doc) as connection:
+            success = await asyncio.to_thread(
+                connection.send_email,
+                to_email=sender_email,
+                subject=subject,
+                body=email_doc['draft'],
+                body_html=email_doc['draft_html'],
+                message_id_to_reply=email_doc['message_id'],
+                references=email_doc.get('references', '')
+            )
         
         if success:
             # Update status to sent
@@ -1253,8 +1655,17 @@ async def process_email_async(email_id: str):
             logger.info(f"🚫 Ignored delivery error email: {email_message.subject}")
             return
         
-        # Step 2: Classify intents (now takes EmailMessage object)
-        intents = await classify_email_intents(email_message)
+        # Step 2: Classify intents, embedding the body once for classification, drafting and validation.
+        # The account and thread history don't depend on the intents, so fetch them meanwhile
+        email_embedding = await get_cohere_embedding(email_message.body)
+        intents, account, thread_history = await asyncio.gather(
+            classify_email_intents(email_message, email_embedding),
+            db.email_accounts.find_one({"id": email_message.account_id}),
+            get_thread_history(email_message)
+        )
+        
+        # KB context depends on the intents (keywords and links); both drafting and validation use it
+        kb_data = await get_enhanced_knowledge_context(email_message.body, intents, email_embedding)
         
         # Update email with intents
         await db.emails.update_one(
@@ -1263,7 +1674,7 @@ async def process_email_async(email_id: str):
         )
         
         # Step 3: Generate draft
-        draft = await generate_draft(email_message, intents)
+        draft = await generate_draft(email_message, intents, email_embedding, kb_data, account, thread_history)
         
         # Update email with draft
         await db.emails.update_one(
@@ -1276,7 +1687,7 @@ async def process_email_async(email_id: str):
         )
         
         # Step 4: Validate draft
-        validation = await validate_draft(email_message, draft, intents)
+        validation = await validate_draft(email_message, draft, intents, email_embedding, kb_data, thread_history)
         
         # Step 5: Determine final status based on validation
         if validation["status"] == "SKIP":
@@ -1350,10 +1761,30 @@ async def redraft_email(email_id: str):
     updated_email = await db.emails.find_one({"id": email_id})
     return EmailMessage(**updated_email)
 
-@api_router.get("/emails", response_model=List[EmailMessage])
-async def get_emails():
-    emails = await db.emails.find().sort("received_at", -1).to_list(100)
-    return [EmailMessage(**email) for email in emails]
+# Large fields the email list leaves out unless asked for with ?fields=; GET /emails/{id} has them all
+@api_router.get("/emails", response_model=List[EmailListItem])
+async def get_emails(limit: int = 100, before: Optional[datetime] = None, status: Optional[str] = None,
+                     fields: Optional[str] = None):
+    """List emails newest first, a page at a time: pass the last received_at as `before` for the next page.
+    
+    Only the EmailListItem fields are returned; `fields` (comma-separated) narrows the rows to a
+    subset of them, and `status` filters on the email status. GET /emails/{id} has the full email.
+    """
+    limit = max(1, min(limit, 500))
+    query = {}
+    if before:
+        query["received_at"] = {"$lt": before}
+    if status:
+        query["status"] = status
+    included = None
+    if fields:
+        included = {field for field in fields.split(",") if field in EmailListItem.model_fields} | {"id"}
+    projection = {field: 1 for field in EmailListItem.model_fields}
+    projection["_id"] = 0
+    
+    # Validate through EmailListItem so older documents get its defaults, then serialize directly
+    emails = await db.emails.find(query, projection).sort("received_at", -1).limit(limit).to_list(limit)
+    return ORJSONResponse([EmailListItem(**email_doc).model_dump(include=included) for email_doc in emails])
 
 @api_router.get("/emails/{email_id}", response_model=EmailMessage)
 async def get_email(email_id: str):
@@ -1362,16 +1793,34 @@ async def get_email(email_id: str):
         raise HTTPException(status_code=404, detail="Email not found")
     return EmailMessage(**email_doc)
 
+@api_router.get("/emails/{email_id}/status", response_model=EmailStatus)
+async def get_email_status(email_id: str):
+    """Lightweight status lookup for polling - skips the body, draft and HTML fields"""
+    email_doc = await db.emails.find_one(
+        {"id": email_id},
+        {"_id": 0, "id": 1, "status": 1, "processed_at": 1, "sent_at": 1, "error": 1}
+    )
+    if not email_doc:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return EmailStatus(**email_doc)
+
 # Dashboard/Stats Routes
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats():
-    total_emails = await db.emails.count_documents({})
-    processed_emails = await db.emails.count_documents({"status": {"$in": ["ready_to_send", "sent"]}})
-    escalated_emails = await db.emails.count_documents({"status": "escalate"})
-    sent_emails = await db.emails.count_documents({"status": "sent"})
-    total_intents = await db.intents.count_documents({})
-    total_accounts = await db.email_accounts.count_documents({})
-    active_accounts = await db.email_accounts.count_documents({"is_active": True})
+    # One grouped count per collection, run concurrently
+    status_counts, account_counts, total_intents = await asyncio.gather(
+        db.emails.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]).to_list(None),
+        db.email_accounts.aggregate([{"$group": {"_id": "$is_active", "n": {"$sum": 1}}}]).to_list(None),
+        db.intents.count_documents({})
+    )
+    emails_by_status = {bucket["_id"]: bucket["n"] for bucket in status_counts}
+    
+    total_emails = sum(emails_by_status.values())
+    sent_emails = emails_by_status.get("sent", 0)
+    processed_emails = emails_by_status.get("ready_to_send", 0) + sent_emails
+    escalated_emails = emails_by_status.get("escalate", 0)
+    total_accounts = sum(bucket["n"] for bucket in account_counts)
+    active_accounts = sum(bucket["n"] for bucket in account_counts if bucket["_id"] is True)
     
     # Polling status
     global polling_service
@@ -1412,6 +1861,9 @@ async def startup_event():
     """Initialize services on startup"""
     global polling_service
     logger.info("🚀 Starting up email assistant services...")
+    get_http_client()
+    
+    await ensure_indexes()
     
     # Initialize all seed data
     await initialize_email_accounts()
@@ -1423,13 +1875,31 @@ async def startup_event():
     try:
         polling_service = get_polling_service(mongo_url, os.environ['DB_NAME'])
         # Start polling in background
-        asyncio.create_task(polling_service.start_polling())
+        start_polling_task(polling_service)
         logger.info("✅ Email polling service started automatically")
     except Exception as e:
         logger.error(f"❌ Failed to start email polling service: {str(e)}")
     
     logger.info("🎉 Email assistant system fully initialized and ready!")
 
+async def ensure_indexes():
+    """Create the indexes behind lookups by the app's own id field, the email list/stats queries, and embedding cache expiry"""
+    indexes = [
+        (db.intents, "id", {"unique": True}),
+        (db.email_accounts, "id", {"unique": True}),
+        (db.knowledge_base, "id", {"unique": True}),
+        (db.emails, "id", {"unique": True}),
+        (db.emails, [("status", 1), ("received_at", -1)], {}),
+        (db.emails, [("received_at", -1)], {}),
+        (db.emails, [("thread_id", 1), ("received_at", -1)], {}),
+        (db.embedding_cache, "created_at", {"expireAfterSeconds": EMBEDDING_STORE_TTL}),
+    ]
+    for collection, keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            logger.error(f"❌ Error creating index {keys} on {collection.name}: {str(e)}")
+
 async def initialize_email_accounts():
     """Initialize default email accounts if they don't exist"""
     try:
@@ -1600,19 +2070,22 @@ async def initialize_intents():
                 }
             ]
             
-            # Create intents with embeddings
-            for intent_data in default_intents:
-                intent_obj = Intent(**intent_data)
-                
-                # Create embedding for intent description + examples
-                text_for_embedding = f"{intent_obj.description} {' '.join(intent_obj.examples)}"
-                embedding = await get_cohere_embedding(text_for_embedding)
-                
-                # Store with embedding
+            # Create intents with embeddings for description + examples, in one Cohere call
+            intent_objs = [Intent(**intent_data) for intent_data in default_intents]
+            embeddings = await get_cohere_embeddings([
+                f"{intent_obj.description} {' '.join(intent_obj.examples)}" for intent_obj in intent_objs
+            ])
+            
+            # Store with embedding
+            docs = []
+            for intent_obj, embedding in zip(intent_objs, embeddings):
                 doc = intent_obj.dict()
-                doc["embedding"] = embedding
-                await db.intents.insert_one(doc)
-                
+                doc["embedding"] = normalize_embedding(embedding)
+                doc["embedding_normalized"] = True
+                docs.append(doc)
+            await db.intents.insert_many(docs)
+            
+            invalidate_embedding_index("intents")
             logger.info(f"✅ Created {len(default_intents)} default intents")
         else:
             logger.info(f"ℹ️  Found {existing_intents} existing intents")
@@ -1671,18 +2144,20 @@ async def initialize_knowledge_base():
                 }
             ]
             
-            # Create knowledge base entries with embeddings
-            for kb_data in kb_entries:
-                kb_obj = KnowledgeBase(**kb_data)
-                
-                # Create embedding for content
-                embedding = await get_cohere_embedding(kb_obj.content)
-                
-                # Store with embedding
+            # Create knowledge base entries with embeddings for their content, in one Cohere call
+            kb_objs = [KnowledgeBase(**kb_data) for kb_data in kb_entries]
+            embeddings = await get_cohere_embeddings([kb_obj.content for kb_obj in kb_objs])
+            
+            # Store with embedding
+            docs = []
+            for kb_obj, embedding in zip(kb_objs, embeddings):
                 doc = kb_obj.dict()
-                doc["embedding"] = embedding
-                await db.knowledge_base.insert_one(doc)
-                
+                doc["embedding"] = normalize_embedding(embedding)
+                doc["embedding_normalized"] = True
+                docs.append(doc)
+            await db.knowledge_base.insert_many(docs)
+            
+            invalidate_embedding_index("knowledge_base")
             logger.info(f"✅ Created {len(kb_entries)} knowledge base entries")
         else:
             logger.info(f"ℹ️  Found {existing_kb} existing knowledge base entries")
@@ -1791,5 +2266,8 @@ async def initialize_test_emails():
 async def shutdown_db_client():
     global polling_service
     if polling_service:
-        polling_service.stop_polling()
+        await stop_polling_task(polling_service)
+    http_client = getattr(app.state, "http", None)
+    if http_client is not None:
+        await http_client.aclose()
     client.close()
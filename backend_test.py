@@ -29,6 +29,9 @@ API_BASE = f"{BACKEND_URL}/api"
 MONGO_URL = os.environ['MONGO_URL']
 DB_NAME = os.environ['DB_NAME']
 
+# Statuses the background AI workflow passes through before the email settles
+IN_PROGRESS_STATUSES = {"processing", "classifying", "drafting"}
+
 class EmailAssistantTester:
     def __init__(self):
         self.client = None
@@ -69,6 +72,17 @@ class EmailAssistantTester:
         if details:
             print(f"   Details: {details}")
     
+    async def wait_for_processed_email(self, email_id: str, timeout: float = 30):
+        """Poll the status endpoint until the background AI workflow has finished with the email"""
+        deadline = time.monotonic() + timeout
+        while True:
+            response = requests.get(f"{API_BASE}/emails/{email_id}/status", timeout=10)
+            if response.status_code != 200:
+                return None
+            if response.json().get('status') not in IN_PROGRESS_STATUSES or time.monotonic() >= deadline:
+                return await self.db.emails.find_one({"id": email_id}, {"_id": 0})
+            await asyncio.sleep(0.5)
+    
     async def test_connection_health_check(self):
         """Test 1: Connection Health Check - IMAP connection pooling and reuse"""
         print("\n🔍 Testing Connection Health Check...")
@@ -235,10 +249,11 @@ class EmailAssistantTester:
             try:
                 print("   Testing /api/emails/test endpoint...")
                 response = requests.post(f"{API_BASE}/emails/test", json=test_email_data, timeout=30)
-                test_api_passed = response.status_code in [200, 201]
+                test_api_passed = response.status_code in [200, 201, 202]
                 
                 if test_api_passed:
-                    processed_email = response.json()
+                    # The endpoint returns as soon as the email is stored; processing runs in the background
+                    processed_email = await self.wait_for_processed_email(response.json()['id']) or response.json()
                     print(f"   ✅ Email processed via API - Status: {processed_email.get('status')}")
                     
                     # Check if AI workflow completed successfully
@@ -1208,7 +1223,7 @@ class EmailAssistantTester:
                     test_data["account_id"] = accounts_response.json()[0]["id"]
                 
                 response = requests.post(f"{API_BASE}/emails/test", json=test_data, timeout=15)
-                test_email_passed = response.status_code in [200, 201]
+                test_email_passed = response.status_code in [200, 201, 202]
                 test_email_details = f"Status: {response.status_code}"
             except Exception as e:
                 test_email_passed = False
@@ -15,6 +15,22 @@ load_dotenv('/app/frontend/.env')
 BACKEND_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://email-detect-fix.preview.emergentagent.com')
 API_BASE = f"{BACKEND_URL}/api"
 
+# Statuses the background AI workflow passes through before the email settles
+IN_PROGRESS_STATUSES = {"processing", "classifying", "drafting"}
+
+def wait_for_processing(email_id, timeout=30):
+    """Poll the email's status until the background AI workflow has finished with it, then fetch it"""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = requests.get(f"{API_BASE}/emails/{email_id}/status", timeout=10)
+        if response.status_code != 200:
+            return None
+        if response.json().get('status') not in IN_PROGRESS_STATUSES or time.monotonic() >= deadline:
+            break
+        time.sleep(0.5)
+    response = requests.get(f"{API_BASE}/emails/{email_id}", timeout=10)
+    return response.json() if response.status_code == 200 else None
+
 def test_auto_send():
     print("🧪 Testing Auto-Send Functionality...")
     
@@ -43,12 +59,12 @@ def test_auto_send():
     print("📧 Creating test email...")
     response = requests.post(f"{API_BASE}/emails/test", json=test_data, timeout=30)
     
-    if response.status_code not in [200, 201]:
+    if response.status_code not in [200, 201, 202]:
         print(f"❌ Email creation failed: {response.status_code}")
         return False
     
-    email = response.json()
-    email_id = email.get('id')
+    email_id = response.json().get('id')
+    email = wait_for_processing(email_id) or response.json()
     initial_status = email.get('status')
     
     print(f"✅ Email created - ID: {email_id}")
@@ -1701,6 +1701,20 @@ const EmailTesting = () => {
     try {
       const response = await axios.post(`${API}/emails/test`, formData);
       setResult(response.data);
+
+      // Processing runs in the background; poll the lightweight status until the workflow
+      // settles, then load the full email once for the results panel
+      const inProgress = ['processing', 'classifying', 'drafting'];
+      const emailId = response.data.id;
+      let status = response.data.status;
+      for (let attempt = 0; attempt < 60 && inProgress.includes(status); attempt++) {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        status = (await axios.get(`${API}/emails/${emailId}/status`)).data.status;
+        setResult((prev) => ({ ...prev, status }));
+      }
+      if (status !== response.data.status) {
+        setResult((await axios.get(`${API}/emails/${emailId}`)).data);
+      }
     } catch (error) {
       console.error('Error testing email:', error);
       setResult({ error: 'Failed to process email' });